@@ -0,0 +1,94 @@
+import asyncio, os
+from datetime import datetime, timezone
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import AsyncSessionLocal
+from .models import Logs
+
+AUDIT_LOG_SYNC = os.getenv("AUDIT_LOG_SYNC", "0") == "1"
+AUDIT_LOG_BATCH_SIZE = int(os.getenv("AUDIT_LOG_BATCH_SIZE", "200"))
+AUDIT_LOG_FLUSH_INTERVAL = float(os.getenv("AUDIT_LOG_FLUSH_INTERVAL", "2"))
+## Past this many buffered events, e.g. while the database is down, events are written by the caller instead
+AUDIT_LOG_MAX_PENDING = int(os.getenv("AUDIT_LOG_MAX_PENDING", "10000"))
+
+class AuditLog:
+    def __init__(self, batch_size: int = AUDIT_LOG_BATCH_SIZE, flush_interval: float = AUDIT_LOG_FLUSH_INTERVAL, sync: bool = AUDIT_LOG_SYNC, max_pending: int = AUDIT_LOG_MAX_PENDING):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sync = sync
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.batches = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self._pending: list[dict] = []
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    async def log(self, event: str, user_id: int, db: AsyncSession):
+        if self.sync:
+            db.add(Logs(event=event, user_id=user_id))
+            await db.commit()
+            return
+        if len(self._pending) >= self.max_pending:
+            try:
+                db.add(Logs(event=event, user_id=user_id))
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                self.dropped += 1
+            return
+        self._pending.append({"event": event, "user_id": user_id, "time": datetime.now(timezone.utc)})
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                try:
+                    async with AsyncSessionLocal() as db:
+                        await db.execute(insert(Logs), batch)
+                        await db.commit()
+                except BaseException:
+                    ## A cancelled flush puts its batch back too
+                    self._pending[:0] = batch
+                    self.failed_flushes += 1
+                    raise
+                self.flushed += len(batch)
+                self.batches += 1
+
+    async def run(self):
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                await asyncio.sleep(self.flush_interval)
+        self._stopping = False
+
+    def stop(self):
+        ## run returns after its current flush, the caller flushes what is left
+        self._stopping = True
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        return {
+            "sync": self.sync,
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+        }
+
+audit_log = AuditLog()
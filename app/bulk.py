@@ -0,0 +1,38 @@
+import csv, io, json
+from pydantic import TypeAdapter, ValidationError
+
+MAX_IMPORT_ROWS = 5000
+
+class BulkImportError(ValueError):
+    pass
+
+def parse_rows(body: bytes, content_type: str | None) -> list[dict]:
+    try:
+        text = body.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BulkImportError("Body must be UTF-8 encoded")
+    if content_type and content_type.split(";")[0].strip() == "text/csv":
+        rows = [
+            {key.strip(): value for key, value in row.items() if key and value not in (None, "")}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    else:
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError:
+            raise BulkImportError("Body must be a JSON array or text/csv")
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise BulkImportError("Body must be a JSON array of objects")
+    if len(rows) > MAX_IMPORT_ROWS:
+        raise BulkImportError(f"Cannot import more than {MAX_IMPORT_ROWS} rows at once")
+    return rows
+
+def validate_rows(model, rows: list[dict]) -> list[tuple[object | None, str | None]]:
+    adapter = TypeAdapter(model)
+    validated = []
+    for row in rows:
+        try:
+            validated.append((adapter.validate_python(row), None))
+        except ValidationError as error:
+            validated.append((None, "; ".join(f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" for detail in error.errors())))
+    return validated
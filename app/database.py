@@ -1,13 +1,129 @@
-from sqlalchemy import create_engine
+import asyncio
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
+from .instrumentation import instrument_engine
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/app.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}
-)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+psycopg",
+    "postgresql+psycopg": "postgresql+psycopg",
+    ## asyncpg is not a dependency, psycopg 3 serves the async engine for psycopg2 URLs too
+    "postgresql+psycopg2": "postgresql+psycopg",
+}
+
+def async_database_url(url: str) -> str:
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername)).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", async_database_url(DATABASE_URL))
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+
+## Connection pool settings, only used for server databases such as PostgreSQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+## SQLite connection profile, applied to every new connection. Set a value to an empty string to keep SQLite's default
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT", "5000"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-20000"),
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", "268435456"),
+    "foreign_keys": os.getenv("SQLITE_FOREIGN_KEYS", ""),
+}
+SQLITE_SERIALIZE_WRITES = os.getenv("SQLITE_SERIALIZE_WRITES", "0") == "1"
+
+def engine_options(is_async: bool) -> dict:
+    if IS_SQLITE:
+        return {} if is_async else {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+engine = create_engine(DATABASE_URL, **engine_options(is_async=False))
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(is_async=True))
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        if value:
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+if IS_SQLITE:
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+
+write_lock = asyncio.Lock()
+
+class SerializedAsyncSession(AsyncSession):
+    ## Holds the process wide write lock from the first write until the transaction ends,
+    ## so concurrent writers queue here instead of failing with "database is locked"
+    _holds_write_lock = False
+
+    async def _acquire_write_lock(self):
+        if not self._holds_write_lock:
+            ## Check out the connection before waiting for the lock, so the lock holder never waits on the pool
+            await self.connection()
+            await write_lock.acquire()
+            self._holds_write_lock = True
+
+    def _release_write_lock(self):
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            write_lock.release()
+
+    async def execute(self, statement, *args, **kwargs):
+        if getattr(statement, "is_dml", False):
+            await self._acquire_write_lock()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None):
+        await self._acquire_write_lock()
+        await super().flush(objects)
+
+    async def commit(self):
+        if self.new or self.dirty or self.deleted:
+            await self._acquire_write_lock()
+        try:
+            await super().commit()
+        finally:
+            self._release_write_lock()
+
+    async def rollback(self):
+        try:
+            await super().rollback()
+        finally:
+            self._release_write_lock()
+
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            self._release_write_lock()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
\ No newline at end of file
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=SerializedAsyncSession if SQLITE_SERIALIZE_WRITES and IS_SQLITE else AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+Base = declarative_base()
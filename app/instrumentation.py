@@ -0,0 +1,136 @@
+import logging, os, time
+from collections import defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from sqlalchemy import event
+
+DEBUG_HEADERS = os.getenv("DEBUG_HEADERS", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RequestStats:
+    started: float = field(default_factory=time.perf_counter)
+    queries: int = 0
+    db_time: float = 0.0
+    slow_queries: int = 0
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+@dataclass
+class RouteMetrics:
+    requests: dict[tuple[str, int], int] = field(default_factory=lambda: defaultdict(int))
+    buckets: list[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    duration: float = 0.0
+    count: int = 0
+    queries: int = 0
+    db_time: float = 0.0
+    slow_queries: int = 0
+
+class Metrics:
+    def __init__(self):
+        self.routes: dict[str, RouteMetrics] = defaultdict(RouteMetrics)
+        self.untracked_queries = 0
+        self.untracked_slow_queries = 0
+
+    def observe_request(self, route: str, method: str, status_code: int, stats: RequestStats, duration: float):
+        metrics = self.routes[route]
+        metrics.requests[(method, status_code)] += 1
+        metrics.count += 1
+        metrics.duration += duration
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                metrics.buckets[index] += 1
+        metrics.queries += stats.queries
+        metrics.db_time += stats.db_time
+        metrics.slow_queries += stats.slow_queries
+
+    def render(self, gauges: dict[str, dict]) -> str:
+        ## Every family is one block, its TYPE line followed by the samples of all routes
+        routes = sorted(self.routes.items())
+        lines = ["# TYPE http_requests_total counter"]
+        for route, metrics in routes:
+            for (method, status_code), count in sorted(metrics.requests.items()):
+                lines.append(f'http_requests_total{{route="{route}",method="{method}",status="{status_code}"}} {count}')
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for route, metrics in routes:
+            for bound, count in zip(LATENCY_BUCKETS, metrics.buckets):
+                lines.append(f'http_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {metrics.count}')
+            lines.append(f'http_request_duration_seconds_sum{{route="{route}"}} {metrics.duration:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{route="{route}"}} {metrics.count}')
+        lines.append("# TYPE db_queries_total counter")
+        for route, metrics in routes:
+            lines.append(f'db_queries_total{{route="{route}"}} {metrics.queries}')
+        ## Background tasks and CLI commands run outside a request
+        lines.append(f'db_queries_total{{route="background"}} {self.untracked_queries}')
+        lines.append("# TYPE db_query_duration_seconds_total counter")
+        for route, metrics in routes:
+            lines.append(f'db_query_duration_seconds_total{{route="{route}"}} {metrics.db_time:.6f}')
+        lines.append("# TYPE db_slow_queries_total counter")
+        for route, metrics in routes:
+            lines.append(f'db_slow_queries_total{{route="{route}"}} {metrics.slow_queries}')
+        lines.append(f'db_slow_queries_total{{route="background"}} {self.untracked_slow_queries}')
+        for component, stats in gauges.items():
+            for key, value in stats.items():
+                if isinstance(value, (bool, int, float)):
+                    lines.append(f"# TYPE {component}_{key} gauge")
+                    lines.append(f"{component}_{key} {float(value)}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._query_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._query_started
+    slow = elapsed * 1000 >= SLOW_QUERY_MS
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        stats.slow_queries += slow
+    else:
+        metrics.untracked_queries += 1
+        metrics.untracked_slow_queries += slow
+    if slow:
+        logger.warning("Slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split())[:500])
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if DEBUG_HEADERS:
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [
+                        (b"x-query-count", str(stats.queries).encode()),
+                        (b"x-db-time-ms", f"{stats.db_time * 1000:.2f}".encode()),
+                        (b"x-response-time-ms", f"{(time.perf_counter() - stats.started) * 1000:.2f}".encode()),
+                        (b"x-slow-queries", str(stats.slow_queries).encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            route = scope.get("route")
+            metrics.observe_request(route.path if route else "unmatched", scope["method"], status_code, stats, time.perf_counter() - stats.started)
@@ -0,0 +1,226 @@
+import asyncio, fcntl, gzip, heapq, json, os
+from datetime import datetime, timedelta, timezone
+from itertools import takewhile
+from sqlalchemy import Select, delete, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import AsyncSessionLocal
+from .models import Logs, Settings
+from .streaming import STREAM_BATCH_SIZE, stream_rows
+
+## 0 keeps every log row in the database
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "0"))
+LOG_ARCHIVE_DIR = os.getenv("LOG_ARCHIVE_DIR", "./data/log_archive")
+LOG_ARCHIVE_INTERVAL = int(os.getenv("LOG_ARCHIVE_INTERVAL", "3600"))
+LOG_ARCHIVE_BATCH_SIZE = 5000
+ARCHIVED_ID_SETTING = "log_archived_id"
+
+def as_utc(value: datetime | None) -> datetime | None:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def merge_logs(archived, live) -> list:
+    ## Rows archived by a run that crashed before deleting them can be in both
+    logs = []
+    for log in heapq.merge(archived, live, key=lambda log: log.id):
+        if not logs or log.id > logs[-1].id:
+            logs.append(log)
+    return logs
+
+class LogArchive:
+    ## Segments are logs-YYYY-MM.jsonl.gz, each run appends one gzip member per month.
+    ## index.json holds the offset and id range of every member, so reads can seek past older rows
+    def __init__(self, directory: str = LOG_ARCHIVE_DIR, retention_days: int = LOG_RETENTION_DAYS):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.archived = 0
+        self.runs = 0
+        self.failed_runs = 0
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, "index.json")
+
+    def segment_path(self, month: str) -> str:
+        return os.path.join(self.directory, f"logs-{month}.jsonl.gz")
+
+    def has_archives(self) -> bool:
+        return os.path.exists(self.index_path)
+
+    def load_index(self) -> dict:
+        try:
+            with open(self.index_path) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    async def archive(self, db: AsyncSession) -> int:
+        if self.retention_days <= 0:
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        archived = 0
+        ## Workers archive one at a time, each reading the claimed id only once it holds the lock
+        lock = await asyncio.to_thread(self._lock)
+        try:
+            while True:
+                archived_id = await self._archived_id(db)
+                rows = (await db.execute(
+                    select(Logs).where(Logs.id > archived_id).order_by(Logs.id).limit(LOG_ARCHIVE_BATCH_SIZE)
+                )).scalars().all()
+                ## Only a prefix of ids is archived, so every segment stays sorted by id
+                batch = list(takewhile(lambda log: as_utc(log.time) < cutoff, rows))
+                if not batch:
+                    break
+                records = [{"id": log.id, "event": log.event, "time": as_utc(log.time).isoformat(), "user_id": log.user_id} for log in batch]
+                await asyncio.to_thread(self._append, records)
+                claimed = await db.execute(
+                    update(Settings).where((Settings.key == ARCHIVED_ID_SETTING) & (Settings.value == str(archived_id))).values(value=str(batch[-1].id))
+                )
+                if claimed.rowcount != 1:
+                    await db.rollback()
+                    break
+                await db.execute(delete(Logs).where(Logs.id.in_([log.id for log in batch])))
+                await db.commit()
+                archived += len(batch)
+                if len(batch) < LOG_ARCHIVE_BATCH_SIZE:
+                    break
+        except Exception:
+            self.failed_runs += 1
+            raise
+        finally:
+            lock.close()
+            self.runs += 1
+            self.archived += archived
+        return archived
+
+    async def run(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.archive(db)
+            except Exception:
+                pass
+            await asyncio.sleep(LOG_ARCHIVE_INTERVAL)
+
+    def read(self, user_id: int | None, start: datetime | None, end: datetime | None, cursor: int | None, limit: int) -> list[dict]:
+        start, end = as_utc(start), as_utc(end)
+        cursor = cursor or 0
+        index = self.load_index()
+        streams = [
+            self._read_segment(month, members, user_id, start, end, cursor)
+            for month, members in sorted(index.items())
+            if members[-1]["last_id"] > cursor
+            and (start is None or month >= start.strftime("%Y-%m"))
+            and (end is None or month <= end.strftime("%Y-%m"))
+        ]
+        rows = []
+        try:
+            for row in heapq.merge(*streams, key=lambda row: row["id"]):
+                if row["id"] <= cursor:
+                    continue
+                rows.append(row)
+                cursor = row["id"]
+                if len(rows) >= limit:
+                    break
+        finally:
+            for stream in streams:
+                stream.close()
+        return rows
+
+    async def stream(self, query: Select, user_id: int | None, start: datetime | None, end: datetime | None, cursor: int | None):
+        ## Archived rows are read a batch at a time off the event loop, then the live table follows
+        if self.has_archives():
+            while True:
+                rows = await asyncio.to_thread(self.read, user_id, start, end, cursor, STREAM_BATCH_SIZE)
+                for row in rows:
+                    yield row
+                if rows:
+                    cursor = rows[-1]["id"]
+                if len(rows) < STREAM_BATCH_SIZE:
+                    break
+        if cursor is not None:
+            query = query.where(Logs.id > cursor)
+        async for row in stream_rows(query.order_by(Logs.id)):
+            yield row
+
+    def stats(self) -> dict:
+        index = self.load_index()
+        return {
+            "retention_days": self.retention_days,
+            "segments": len(index),
+            "archived_rows": sum(member["rows"] for members in index.values() for member in members),
+            "archived": self.archived,
+            "runs": self.runs,
+            "failed_runs": self.failed_runs,
+        }
+
+    async def _archived_id(self, db: AsyncSession) -> int:
+        archived_id = await db.scalar(select(Settings.value).where(Settings.key == ARCHIVED_ID_SETTING))
+        if archived_id is not None:
+            return int(archived_id)
+        try:
+            db.add(Settings(key=ARCHIVED_ID_SETTING, value="0"))
+            await db.commit()
+        except IntegrityError:
+            ## Another worker created it first
+            await db.rollback()
+        return int(await db.scalar(select(Settings.value).where(Settings.key == ARCHIVED_ID_SETTING)))
+
+    def _lock(self):
+        ## flock conflicts between open files of the same process too, so it also serializes coroutines
+        os.makedirs(self.directory, exist_ok=True)
+        lock = open(os.path.join(self.directory, ".lock"), "w")
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _append(self, records: list[dict]):
+        ## Called with the lock held. Rows written by a run that crashed before its claim committed are skipped
+        index = self.load_index()
+        last_id = max((members[-1]["last_id"] for members in index.values()), default=0)
+        months: dict[str, list[dict]] = {}
+        for record in records:
+            if record["id"] > last_id:
+                months.setdefault(record["time"][:7], []).append(record)
+        if not months:
+            return
+        for month, month_records in months.items():
+            with open(self.segment_path(month), "ab") as file:
+                offset = file.tell()
+                with gzip.GzipFile(fileobj=file, mode="wb") as segment:
+                    segment.write("".join(json.dumps(record) + "\n" for record in month_records).encode())
+                file.flush()
+                os.fsync(file.fileno())
+            index.setdefault(month, []).append({
+                "offset": offset,
+                "first_id": month_records[0]["id"],
+                "last_id": month_records[-1]["id"],
+                "rows": len(month_records),
+            })
+        with open(self.index_path + ".tmp", "w") as file:
+            json.dump(index, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def _read_segment(self, month: str, members: list[dict], user_id: int | None, start: datetime | None, end: datetime | None, cursor: int):
+        offset = next(member["offset"] for member in members if member["last_id"] > cursor)
+        with open(self.segment_path(month), "rb") as file:
+            file.seek(offset)
+            ## Reads on through the following members, a member cut short by a crash ends the segment
+            with gzip.GzipFile(fileobj=file, mode="rb") as segment:
+                try:
+                    for line in segment:
+                        row = json.loads(line)
+                        if row["id"] <= cursor or (user_id is not None and row["user_id"] != user_id):
+                            continue
+                        row["time"] = datetime.fromisoformat(row["time"])
+                        if (start is not None and row["time"] < start) or (end is not None and row["time"] >= end):
+                            continue
+                        yield row
+                except (EOFError, gzip.BadGzipFile, json.JSONDecodeError):
+                    return
+
+log_archive = LogArchive()
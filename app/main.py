@@ -1,53 +1,103 @@
-import asyncio, random, string
-from datetime import datetime, timedelta, timezone
+import asyncio, json
+from datetime import date, datetime, timedelta, timezone
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, status
+from fastapi import FastAPI, Depends, HTTPException, Request as HttpRequest, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.params import Body, Header, Path
-from sqlalchemy import delete
-from sqlalchemy.orm import Session
-from .database import Base, engine, SessionLocal
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.params import Body, Header, Path, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from sqlalchemy import case, delete, func, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from .database import engine, AsyncSessionLocal
+from .migrations import AUTO_MIGRATE, setup
+from .auditlog import audit_log
+from .bulk import BulkImportError, parse_rows, validate_rows
+from .streaming import GZIP_LEVEL, GZIP_MINIMUM_SIZE, csv_stream, json_array_stream, stream_format, stream_response, stream_rows
+from .reports import TIMESHEET_COLUMNS, timesheet_query, timesheet_row, timesheet_rows
+from .rollups import apply_worked_time
+from .presence import PRESENCE_RECONCILE_INTERVAL, presence
+from .responsecache import response_cache
+from .instrumentation import InstrumentationMiddleware, metrics
+from .sessiontokens import SESSION_REVOCATION_SYNC, SIGNED_SESSIONS, session_tokens
+from .teamcalendar import MAX_CALENDAR_DAYS, team_calendar
+from . import ratelimit
+from .ratelimit import check_in_per_device, check_in_per_ip, check_in_per_user, enforce, login_per_ip, login_per_username, login_verifications
+from .logarchive import LOG_RETENTION_DAYS, as_utc, log_archive, merge_logs
+from .pagination import MAX_PAGE_SIZE, keyset, page_size, split_page
 from .models import *
 from .security import *
 from .requestmodels import *
+from .responsemodels import *
+from .sessioncache import CachedRole, CachedUser, session_cache
 from sqlalchemy import or_
-Base.metadata.create_all(bind=engine)
 
-LastCheckInCode: str = None
-GenTime: datetime = None
-MinBufferTime: int = 1
-CurrCheckInCode: str = None
-
-db = SessionLocal()
-try:
-    seed_defaults(db)
-finally:
-    db.close()
+MaxPunchBatch: int = 1000
+MaxPunchClockSkew: int = 5
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    ## A version check only, unless the schema is missing or outdated
+    await asyncio.to_thread(setup, engine, AUTO_MIGRATE)
+
     async def periodic_cleanup():
         while True:
-            db = SessionLocal()
             try:
-                db.execute(
-                    delete(Sessions).where(
-                        Sessions.activeUntil < datetime.now(timezone.utc)
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        delete(Sessions).where(
+                            Sessions.activeUntil < datetime.now(timezone.utc)
+                        )
                     )
-                )
-                db.commit()
-            finally:
-                db.close()
+                    await db.commit()
+                    if SIGNED_SESSIONS:
+                        await session_tokens.purge_expired(db)
+            except Exception:
+                pass
+            session_cache.purge_expired()
             await asyncio.sleep(60)  #3600 every hour
-
-    async def gen_check_in():
+    async def sync_revocations():
         while True:
-            gen_check_in_code()
-            await asyncio.sleep(60)  #3600 every hour
-    task = asyncio.create_task(periodic_cleanup())
-    task = asyncio.create_task(gen_check_in())
+            await asyncio.sleep(SESSION_REVOCATION_SYNC)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await session_tokens.sync(db)
+            except Exception:
+                pass
+    async def reconcile_presence():
+        while True:
+            await asyncio.sleep(PRESENCE_RECONCILE_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await presence.load(db)
+            except Exception:
+                pass
+
+    async with AsyncSessionLocal() as db:
+        await presence.load(db)
+        if SIGNED_SESSIONS:
+            await session_tokens.sync(db)
+    tasks = [
+        asyncio.create_task(periodic_cleanup()),
+        asyncio.create_task(reconcile_presence()),
+    ]
+    audit_task = asyncio.create_task(audit_log.run())
+    if SIGNED_SESSIONS:
+        tasks.append(asyncio.create_task(sync_revocations()))
+    if LOG_RETENTION_DAYS > 0:
+        tasks.append(asyncio.create_task(log_archive.run()))
     yield
-    task.cancel()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    ## Stopped rather than cancelled, so no batch is cut off mid-insert
+    audit_log.stop()
+    await asyncio.gather(audit_task, return_exceptions=True)
+    await audit_log.flush()
+    hash_pool.shutdown()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -59,168 +109,352 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"],
 )
+## Server-Sent Events are in GZipMiddleware's excluded content types, so /presence/stream isn't buffered
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
+app.add_middleware(InstrumentationMiddleware)
 
-def get_db():
-    db = SessionLocal()
-    try:
+@app.exception_handler(StarletteHTTPException)
+async def http_exception_handler(request: HttpRequest, exc: StarletteHTTPException):
+    return JSONResponse({"message": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+
+def client_ip(request: HttpRequest) -> str:
+    return request.client.host if request.client else "unknown"
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def validate_session(session_token: str, db: Session):
-    session = db.query(Sessions).filter(Sessions.session_token == session_token).first()
+async def validate_session(session_token: str, db: AsyncSession):
+    if SIGNED_SESSIONS: return session_tokens.validate(session_token)
+    generation = session_cache.generation
+    cached_user = session_cache.get(session_token)
+    if cached_user: return cached_user
+    session = (await db.execute(
+        select(Sessions).options(
+            joinedload(Sessions.user).joinedload(Users.role)
+        ).where(Sessions.session_token == session_token)
+    )).scalars().first()
     if session:
         if session.activeUntil.tzinfo is None:
             session.activeUntil = session.activeUntil.replace(tzinfo=timezone.utc)
         if session.activeUntil > datetime.now(timezone.utc):
-            return session.user
+            user = session.user
+            cached_user = CachedUser(id=user.id, role=CachedRole(id=user.role.id, role=user.role.role))
+            session_cache.put(session_token, cached_user, session.activeUntil, generation)
+            return cached_user
         else:
-            db.delete(session)
+            await db.delete(session)
             return None
     else:
         return None
 
 
-@app.get("/valid_session", tags=["Session"])
-def validate_session_token(session_token: str = Header(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Session is not valid"}, 400
-    return {"message": "Valid session"}, status.HTTP_200_OK
-
-@app.get("/self", tags=["Session"])
-def self_get(session_token: str = Header(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Session is not valid"}, 400
-    return {"message": "Successfully got user", "user": {
-        "id": request_user.id,
-        "username": request_user.username,
-        "name": request_user.name,
-        "created_at": request_user.created_at,
-        "role": {
-            "id": request_user.role.id,
-            "role": request_user.role.role
-        }
-    }}, status.HTTP_200_OK
-
-@app.post("/login", tags=["Session"])
-def login(username: str = Body(...), password: str = Body(...), db: Session = Depends(get_db)):
-
-    user = db.query(Users).filter(Users.username == username).first()
-    if user and verify_password(password, user.hashed_pass):
-        session = Sessions(user=user)
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        log(f"User logged in", user.id, db)
-
-        return {"message": "Login successful", "user_id": user.id, "session_token": session.session_token}, 200
-    return {"message": "Invalid username or password"}, status.HTTP_401_UNAUTHORIZED
-
-@app.post("/logout", tags=["Session"])
-def logout(session_token: str = Header(...), db: Session = Depends(get_db)):
-    session = db.query(Sessions).filter(Sessions.session_token == session_token).first()
+@app.get("/valid_session", tags=["Session"], response_model=Message)
+async def validate_session_token(session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Session is not valid")
+    return Message(message="Valid session")
+
+@app.get("/self", tags=["Session"], response_model=User_Response)
+async def self_get(session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Session is not valid")
+    request_user = (await db.execute(select(Users).options(joinedload(Users.role)).where(Users.id == request_user.id))).scalars().first()
+    return User_Response(message="Successfully got user", user=request_user)
+
+@app.post("/login", tags=["Session"], response_model=Login_Response)
+async def login(request: HttpRequest, username: str = Body(...), password: str = Body(...), db: AsyncSession = Depends(get_db)):
+    enforce((login_per_ip, client_ip(request)), (login_per_username, username.lower()))
+    with login_verifications.enter():
+        user = (await db.execute(select(Users).options(joinedload(Users.role)).where(Users.username == username))).scalars().first()
+        verified = user and await verify_password_async(password, user.hashed_pass)
+    if verified:
+        if password_needs_rehash(user.hashed_pass):
+            user.hashed_pass = await get_password_hash_async(password)
+        if SIGNED_SESSIONS:
+            session_token = session_tokens.issue(user.id, user.role.id, user.role.role)
+            await db.commit()
+        else:
+            session = Sessions(user=user)
+            db.add(session)
+            await db.commit()
+            await db.refresh(session)
+            session_token = session.session_token
+        await log(f"User logged in", user.id, db)
+
+        return Login_Response(message="Login successful", user_id=user.id, session_token=session_token)
+    raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid username or password")
+
+@app.post("/logout", tags=["Session"], response_model=Message)
+async def logout(session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    if SIGNED_SESSIONS:
+        request_user = await session_tokens.revoke_token(db, session_token)
+        if not request_user: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid session token")
+        await log("User logged out", request_user.id, db)
+        return Message(message="Successfully logged out")
+    session = (await db.execute(select(Sessions).where(Sessions.session_token == session_token))).scalars().first()
     if session:
-        log("User logged out", session.user.id, db)
-        db.delete(session)
-        db.commit()
-        return {"message": "Successfully logged out"}, status.HTTP_200_OK
+        await log("User logged out", session.user_id, db)
+        await db.delete(session)
+        await db.commit()
+        session_cache.invalidate(session_token)
+        return Message(message="Successfully logged out")
     else:
-        return {"message": "Invalid session token"}, status.HTTP_401_UNAUTHORIZED
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid session token")
 
-@app.post("/user", tags=["User"])
-def user_create(session_token: str = Header(...), user: User = Body(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
+@app.post("/user", tags=["User"], response_model=Message, status_code=status.HTTP_201_CREATED)
+async def user_create(session_token: str = Header(...), user: User = Body(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
     if request_user:
         if request_user.role.role != 'leder':
-            return {"message": "Invalid Permissions"}, status.HTTP_403_FORBIDDEN
-        new_user = Users(username=user.username, name=user.name, hashed_pass=get_password_hash(user.password), role_id=user.role_id)
+            raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid Permissions")
+        new_user = Users(username=user.username, name=user.name, hashed_pass=await get_password_hash_async(user.password), role_id=user.role_id)
         try:
             db.add(new_user)
-            db.commit()
-            db.refresh(new_user)
+            await db.commit()
+            await db.refresh(new_user)
         except Exception:
-            return {"message": "User already exists"}, status.HTTP_400_BAD_REQUEST
-        log(f"User with id \"{new_user.id}\" was created", request_user.id, db)
-        return {"message": "Creation Successful"}, status.HTTP_201_CREATED
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "User already exists")
+        await log(f"User with id \"{new_user.id}\" was created", request_user.id, db)
+        return Message(message="Creation Successful")
     else:
-        return {"message": "Invalid session"}, status.HTTP_401_UNAUTHORIZED
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid session")
 
-@app.put("/user/{user_id}", tags=["User"])
-def user_update(session_token: str = Header(...), user_id: int = Path(...), user: User = Body(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
+@app.put("/user/{user_id}", tags=["User"], response_model=Message)
+async def user_update(session_token: str = Header(...), user_id: int = Path(...), user: User = Body(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
     if request_user:
         if request_user.role.role != 'leder' and request_user.id != user_id:
-            return {"message": "Invalid Permissions"}, status.HTTP_403_FORBIDDEN
-        user_to_update = db.query(Users).filter(Users.id == user_id).first()
-        if not user_to_update: return {"message": "Couldn't find user"}, status.HTTP_404_NOT_FOUND
+            raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid Permissions")
+        user_to_update = (await db.execute(select(Users).where(Users.id == user_id))).scalars().first()
+        if not user_to_update: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find user")
         if user.name:
             user_to_update.name = user.name
         if user.username:
             user_to_update.username = user.username
         if user.password:
-            user_to_update.hashed_pass = get_password_hash(user.password)
+            user_to_update.hashed_pass = await get_password_hash_async(user.password)
+        role_changed = False
         if user.role_id != -1 and request_user.role.role == 'leder':
+            role_changed = user_to_update.role_id != user.role_id
             user_to_update.role_id = user.role_id
-        db.commit()
-        log(f"User with id \"{user_id}\" was updated", request_user.id, db)
-        return {"message": "User updated successfully"}, status.HTTP_200_OK
+        await db.commit()
+        session_cache.invalidate_user(user_id)
+        if SIGNED_SESSIONS and role_changed:
+            await session_tokens.revoke_user(db, user_id)
+        await log(f"User with id \"{user_id}\" was updated", request_user.id, db)
+        return Message(message="User updated successfully")
     else:
-        return {"message": "Invalid session"}, status.HTTP_401_UNAUTHORIZED
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid session")
 
-@app.delete("/user/{user_id}", tags=["User"])
-def user_delete(session_token: str = Header(...), user_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
+@app.delete("/user/{user_id}", tags=["User"], response_model=Message)
+async def user_delete(session_token: str = Header(...), user_id: int = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
     if request_user:
         if request_user.role.role != 'leder':
-            return {"message": "Invalid Permissions"}, status.HTTP_403_FORBIDDEN
-        user_to_delete = db.query(Users).filter(Users.id == user_id).first()
+            raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid Permissions")
+        user_to_delete = (await db.execute(select(Users).where(Users.id == user_id))).scalars().first()
         if not user_to_delete:
-            return {"message": "User not found"}, status.HTTP_404_NOT_FOUND
-        db.delete(user_to_delete)
-        db.commit()
-        log(f"User with id \"{user_id}\" was deleted", request_user.id, db)
-        return {"message": "User deleted successfully"}, status.HTTP_200_OK
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+        await db.delete(user_to_delete)
+        await db.commit()
+        session_cache.invalidate_user(user_id)
+        if SIGNED_SESSIONS:
+            await session_tokens.revoke_user(db, user_id)
+        response_cache.invalidate("scheduled_times")
+        team_calendar.invalidate()
+        await log(f"User with id \"{user_id}\" was deleted", request_user.id, db)
+        return Message(message="User deleted successfully")
     else:
-        return {"message": "Session token is required"}, status.HTTP_400_BAD_REQUEST
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Session token is required")
 
-@app.get("/user/{user_id}", tags=["User"])
-def user_get(session_token: str = Header(None), user_id: int = Path(...), db: Session = Depends(get_db)):
+@app.get("/user/{user_id}", tags=["User"], response_model=User_Response)
+async def user_get(session_token: str = Header(None), user_id: int = Path(...), db: AsyncSession = Depends(get_db)):
     request_user = None
     if session_token:
-        request_user = validate_session(session_token, db)
-    user_to_get = db.query(Users).filter(Users.id == user_id).first()
-    if not user_to_get: return {"message": "User not found"}, status.HTTP_404_NOT_FOUND
-    return {"message": "Succesfully got user", "user": {
-        "id": user_to_get.id, 
-        "username": user_to_get.username, 
-        "name": user_to_get.name if (request_user and (request_user.role.role == 'leder' or user_to_get.id == request_user.id)) else None,
-        "role": user_to_get.role,
-        "created_at": user_to_get.created_at
-    }}, status.HTTP_200_OK
-
-
-@app.get("/users", tags=["User"])
-def users_get(session_token: str = Header(None), amount: int = 10, page: int = 1, db: Session = Depends(get_db)):
+        request_user = await validate_session(session_token, db)
+    user_to_get = (await db.execute(select(Users).options(joinedload(Users.role)).where(Users.id == user_id))).scalars().first()
+    if not user_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+    return User_Response(message="Succesfully got user", user=User_Info(
+        id=user_to_get.id,
+        username=user_to_get.username,
+        name=user_to_get.name if (request_user and (request_user.role.role == 'leder' or user_to_get.id == request_user.id)) else None,
+        role=Role.model_validate(user_to_get.role),
+        created_at=user_to_get.created_at
+    ))
+
+
+@app.get("/users", tags=["User"], response_model=Users_Response)
+async def users_get(session_token: str = Header(None), amount: int = 10, cursor: int = None, format: str = None, accept: str = Header(None), db: AsyncSession = Depends(get_db)):
     request_user = None
     if session_token:
-        request_user = validate_session(session_token, db)
-    user_to_get = db.query(Users).offset((page - 1) * amount).limit(amount).all()
-    if not user_to_get: return {"message": "User not found"}, status.HTTP_404_NOT_FOUND
+        request_user = await validate_session(session_token, db)
+    format = stream_format(format, accept)
+    if format:
+        name = Users.name if request_user and request_user.role.role == 'leder' else case((Users.id == (request_user.id if request_user else None), Users.name))
+        columns = [Users.id, Users.username, name.label("name"), Users.role_id, Roles.role, Users.created_at]
+        query = select(*columns).join(Roles, Users.role_id == Roles.id).order_by(Users.id)
+        if cursor is not None:
+            query = query.where(Users.id > cursor)
+        return stream_response(stream_rows(query), [column.key for column in columns], format, "users")
+    user_to_get = (await db.execute(keyset(select(Users).options(joinedload(Users.role)), Users.id, cursor, amount))).scalars().all()
+    if not user_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
+    user_to_get, next_cursor = split_page(user_to_get, amount, lambda user: user.id)
     users_list = [
-        {
-            "id": user.id, 
-            "username": user.username, 
-            "name": user.name if (request_user and (request_user.role.role == 'leder' or user.id == request_user.id)) else None,
-            "role": user.role,
-            "created_at": user.created_at
-        } for user in user_to_get]
-    return {"message": "Succesfully got users", "users": users_list}, status.HTTP_200_OK
-
-@app.post("/scheduled_time", tags=["Schedule"])
-def scheduled_time_create(session_token: str = Header(...), schedule: Schedule_Times = Body(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
+        User_Info(
+            id=user.id,
+            username=user.username,
+            name=user.name if (request_user and (request_user.role.role == 'leder' or user.id == request_user.id)) else None,
+            role=Role.model_validate(user.role),
+            created_at=user.created_at
+        ) for user in user_to_get]
+    return Users_Response(message="Succesfully got users", users=users_list, next_cursor=next_cursor)
+
+@app.post("/users/import", tags=["User"], response_model=Import_Response)
+async def users_import(request: HttpRequest, session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid session")
+    if request_user.role.role != 'leder': raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid Permissions")
+    try:
+        rows = parse_rows(await request.body(), request.headers.get("content-type"))
+    except BulkImportError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error))
+    validated = validate_rows(User, rows)
+    usernames = {user.username for user, _ in validated if user and user.username}
+    existing_usernames = set((await db.execute(select(Users.username).where(Users.username.in_(usernames)))).scalars().all())
+    role_ids = set((await db.execute(select(Roles.id))).scalars().all())
+    results = []
+    users_to_create = []
+    for index, (user, error) in enumerate(validated):
+        if not error:
+            if not user.username or not user.name or not user.password:
+                error = "username, name and password are required"
+            elif len(user.username) > Users.username.type.length:
+                error = f"username can be at most {Users.username.type.length} characters"
+            elif len(user.name) > Users.name.type.length:
+                error = f"name can be at most {Users.name.type.length} characters"
+            elif user.role_id not in role_ids:
+                error = "Invalid role"
+            elif user.username in existing_usernames:
+                error = "User already exists"
+        if error:
+            results.append({"row": index, "status": "error", "message": error})
+            continue
+        existing_usernames.add(user.username)
+        users_to_create.append((index, user))
+        results.append(None)
+    hashed_passwords = await hash_passwords([user.password for _, user in users_to_create])
+    values = [
+        {"username": user.username, "name": user.name, "role_id": user.role_id, "hashed_pass": hashed_pass}
+        for (_, user), hashed_pass in zip(users_to_create, hashed_passwords)
+    ]
+    created = 0
+    if users_to_create:
+        try:
+            created_users = (await db.execute(insert(Users).returning(Users.id, sort_by_parameter_order=True), values)).all()
+            await db.commit()
+            for (index, _), created_user in zip(users_to_create, created_users):
+                results[index] = {"row": index, "status": "created", "id": created_user.id}
+            created = len(created_users)
+        except IntegrityError:
+            ## A username taken since the check above fails the whole batch, so the rows are retried one by one
+            await db.rollback()
+            for (index, _), row in zip(users_to_create, values):
+                try:
+                    created_id = (await db.execute(insert(Users).values(row).returning(Users.id))).scalar_one()
+                    await db.commit()
+                except IntegrityError:
+                    await db.rollback()
+                    results[index] = {"row": index, "status": "error", "message": "User already exists"}
+                    continue
+                results[index] = {"row": index, "status": "created", "id": created_id}
+                created += 1
+        if created:
+            await log(f"Imported {created} users", request_user.id, db)
+    return Import_Response(message=f"Imported {created} of {len(rows)} users", results=results)
+
+@app.get("/users/export", tags=["User"])
+async def users_export(session_token: str = Header(...), format: str = "json", db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid session")
+    if request_user.role.role != 'leder': raise HTTPException(status.HTTP_403_FORBIDDEN, "Invalid Permissions")
+    columns = [Users.id, Users.username, Users.name, Users.role_id, Users.created_at]
+    rows = stream_rows(select(*columns).order_by(Users.id))
+    if format == "csv":
+        return StreamingResponse(csv_stream(rows, [column.key for column in columns]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=users.csv"})
+    return StreamingResponse(json_array_stream(rows), media_type="application/json")
+
+@app.post("/scheduled_times/import", tags=["Schedule"], response_model=Import_Response)
+async def scheduled_times_import(request: HttpRequest, session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    try:
+        rows = parse_rows(await request.body(), request.headers.get("content-type"))
+    except BulkImportError as error:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(error))
+    validated = validate_rows(Schedule_Times, rows)
+    user_ids = {schedule.user_id for schedule, _ in validated if schedule}
+    existing_users = set((await db.execute(select(Users.id).where(Users.id.in_(user_ids)))).scalars().all())
+    results = []
+    schedules_to_create = []
+    for index, (schedule, error) in enumerate(validated):
+        if not error:
+            if schedule.user_id not in existing_users:
+                error = "Invalid user"
+            elif schedule.weekDay is None or not 1 <= schedule.weekDay <= 7:
+                error = "weekDay must be between 1 and 7"
+            elif schedule.startTime is None or schedule.endTime is None:
+                error = "startTime and endTime are required"
+        if error:
+            results.append({"row": index, "status": "error", "message": error})
+            continue
+        schedules_to_create.append((index, schedule))
+        results.append(None)
+    if schedules_to_create:
+        created_schedules = (await db.execute(insert(Scheduled_Times).returning(Scheduled_Times.id, sort_by_parameter_order=True), [
+            {"weekDay": schedule.weekDay, "startTime": schedule.startTime, "endTime": schedule.endTime, "user_id": schedule.user_id, "inactive": bool(schedule.inactive)}
+            for _, schedule in schedules_to_create
+        ])).all()
+        await db.commit()
+        response_cache.invalidate("scheduled_times")
+        team_calendar.invalidate()
+        for (index, _), created_schedule in zip(schedules_to_create, created_schedules):
+            results[index] = {"row": index, "status": "created", "id": created_schedule.id}
+        await log(f"Imported {len(schedules_to_create)} schedules", request_user.id, db)
+    return Import_Response(message=f"Imported {len(schedules_to_create)} of {len(rows)} schedules", results=results)
+
+@app.get("/scheduled_times/export", tags=["Schedule"])
+async def scheduled_times_export(session_token: str = Header(...), user_id: int = None, format: str = "json", db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    columns = [Scheduled_Times.id, Scheduled_Times.user_id, Scheduled_Times.weekDay, Scheduled_Times.startTime, Scheduled_Times.endTime, Scheduled_Times.inactive]
+    query = select(*columns).order_by(Scheduled_Times.id)
+    if user_id is not None:
+        query = query.where(Scheduled_Times.user_id == user_id)
+    rows = stream_rows(query)
+    if format == "csv":
+        return StreamingResponse(csv_stream(rows, [column.key for column in columns]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=scheduled_times.csv"})
+    return StreamingResponse(json_array_stream(rows), media_type="application/json")
+
+@app.get("/calendar", tags=["Schedule"], response_model=Calendar_Response)
+async def calendar_get(session_token: str = Header(...), start: date = None, end: date = None, user_id: list[int] = Query(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not start or not end or end < start: raise HTTPException(status.HTTP_400_BAD_REQUEST, "A valid start and end date is required")
+    if (end - start).days >= MAX_CALENDAR_DAYS: raise HTTPException(status.HTTP_400_BAD_REQUEST, f"The date range can be at most {MAX_CALENDAR_DAYS} days")
+    if not request_user.role.role == 'leder':
+        if user_id and any(calendar_user_id != request_user.id for calendar_user_id in user_id): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+        user_id = [request_user.id]
+    shifts, absences = await team_calendar.expand(db, start, end, user_id)
+    return Calendar_Response(message="Successfully got calendar", start=start, end=end, shifts=shifts, absences=absences)
+
+@app.post("/scheduled_time", tags=["Schedule"], response_model=Message, status_code=status.HTTP_201_CREATED)
+async def scheduled_time_create(session_token: str = Header(...), schedule: Schedule_Times = Body(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
     new_schedule = Scheduled_Times(
         weekDay=schedule.weekDay,
         startTime=schedule.startTime,
@@ -229,156 +463,335 @@ def scheduled_time_create(session_token: str = Header(...), schedule: Schedule_T
         user_id=schedule.user_id,
     )
     db.add(new_schedule)
-    db.commit()
-    db.refresh(new_schedule)
-    log(f"Schedule with id \"{new_schedule.id}\" was created", request_user.id, db)
-    return {"message": "Successfully created schedule"}, status.HTTP_201_CREATED
-
-@app.get("/scheduled_time/{schedule_id}", tags=["Schedule"])
-def schedule_time_get(session_token: str = Header(...), schedule_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    schedule = db.query(Scheduled_Times).filter(Scheduled_Times.id == schedule_id).first()
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder' and (not request_user.role.role == 'leder' and not request_user.id == schedule.user_id): return {"message": "Invalid Permissions"}, 401
-    scheduled_time = db.query(Scheduled_Times).filter(Scheduled_Times.id == schedule_id).first()
-    return {"message": "Succesfully got schedules", "schedule": scheduled_time}, status.HTTP_200_OK
-
-@app.get("/scheduled_times/{user_id}", tags=["Schedule"])
-def schedule_times_get(session_token: str = Header(...), user_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder' and (not request_user.role.role == 'leder' and not request_user.id == user_id): return {"message": "Invalid Permissions"}, 401
-    scheduled_times = db.query(Scheduled_Times).filter(Scheduled_Times.user_id == user_id).all()
-    return {"message": "Succesfully got schedules", "schedules": scheduled_times}, status.HTTP_200_OK
-
-
-@app.put("/scheduled_time/{schedule_id}", tags=["Schedule"])
-def scheduled_time_update(session_token: str = Header(...), schedule_id: int = Path(...), schedule: Schedule_Times = Body(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    schedule_to_update = db.query(Scheduled_Times).filter(Scheduled_Times.id == schedule_id).first()
-    if not schedule_to_update: return {"message": "Couldn't find schedule"}, status.HTTP_404_NOT_FOUND
+    await db.commit()
+    response_cache.invalidate("scheduled_times")
+    team_calendar.invalidate()
+    await db.refresh(new_schedule)
+    await log(f"Schedule with id \"{new_schedule.id}\" was created", request_user.id, db)
+    return Message(message="Successfully created schedule")
+
+@app.get("/scheduled_time/{schedule_id}", tags=["Schedule"], response_model=Schedule_Response)
+async def schedule_time_get(session_token: str = Header(...), schedule_id: int = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    schedule = (await db.execute(select(Scheduled_Times).where(Scheduled_Times.id == schedule_id))).scalars().first()
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not schedule: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find schedule")
+    if not request_user.role.role == 'leder' and (not request_user.role.role == 'leder' and not request_user.id == schedule.user_id): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    scheduled_time = schedule
+    return Schedule_Response(message="Succesfully got schedules", schedule=scheduled_time)
+
+@app.get("/scheduled_times/{user_id}", tags=["Schedule"], response_model=Schedules_Response)
+async def schedule_times_get(session_token: str = Header(...), user_id: int = Path(...), amount: int = MAX_PAGE_SIZE, cursor: int = None, if_none_match: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder' and (not request_user.role.role == 'leder' and not request_user.id == user_id): raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    cache_key = ("scheduled_times", user_id, amount, cursor)
+    generation = response_cache.generation
+    cached = response_cache.get(cache_key)
+    if not cached:
+        scheduled_times = (await db.execute(keyset(select(Scheduled_Times).where(Scheduled_Times.user_id == user_id), Scheduled_Times.id, cursor, amount))).scalars().all()
+        scheduled_times, next_cursor = split_page(scheduled_times, amount, lambda schedule: schedule.id)
+        cached = response_cache.put(cache_key, Schedules_Response(message="Succesfully got schedules", schedules=scheduled_times, next_cursor=next_cursor), generation)
+    return response_cache.response(cached, if_none_match)
+
+
+@app.put("/scheduled_time/{schedule_id}", tags=["Schedule"], response_model=Message)
+async def scheduled_time_update(session_token: str = Header(...), schedule_id: int = Path(...), schedule: Schedule_Times = Body(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    schedule_to_update = (await db.execute(select(Scheduled_Times).where(Scheduled_Times.id == schedule_id))).scalars().first()
+    if not schedule_to_update: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find schedule")
     if schedule.weekDay is not None: schedule_to_update.weekDay = schedule.weekDay
     if schedule.endTime is not None: schedule_to_update.endTime = schedule.endTime
     if schedule.startTime is not None: schedule_to_update.startTime = schedule.startTime
     if schedule.user_id is not None: schedule_to_update.user_id = schedule.user_id
     if schedule.inactive is not None: schedule_to_update.inactive = schedule.inactive
-    db.commit()
-    log(f"Schedule with id \"{schedule_to_update.id}\" was updated", request_user.id, db)
-    return {"Successfully updated schedule"}, status.HTTP_200_OK
-
-@app.delete("/scheduled_time/{schedule_id}", tags=["Schedule"])
-def scheduled_time_delete(session_token: str = Header(...), schedule_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    schedule_to_update = db.query(Scheduled_Times).filter(Scheduled_Times.id == schedule_id).first()
-    if not schedule_to_update: return {"message": "Couldn't find schedule"}, status.HTTP_404_NOT_FOUND
-    log(f"Schedule with id \"{schedule_to_update.id}\" was deleted", request_user.id, db)
-    db.delete(schedule_to_update)
-    db.commit()
-    return {"Sucessfully deleted schedule"}, status.HTTP_200_OK
-
-
-@app.get("/worked_times/{user_id}", tags=["Worked Time"])
-def worked_time_get(session_token: str = Header(...), user_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    worked_times = db.query(Worked_Times).filter(Worked_Times.user_id == user_id).all()
-    return {"message": "Succesfully got worked times", "worked_times": worked_times}, status.HTTP_200_OK
-
-@app.post("/check_in_device/{device_name}", tags=["Check-in"])
-def check_in_device_create(session_token: str = Header(...), device_name: str = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
+    await db.commit()
+    response_cache.invalidate("scheduled_times")
+    team_calendar.invalidate()
+    await log(f"Schedule with id \"{schedule_to_update.id}\" was updated", request_user.id, db)
+    return Message(message="Successfully updated schedule")
+
+@app.delete("/scheduled_time/{schedule_id}", tags=["Schedule"], response_model=Message)
+async def scheduled_time_delete(session_token: str = Header(...), schedule_id: int = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    schedule_to_update = (await db.execute(select(Scheduled_Times).where(Scheduled_Times.id == schedule_id))).scalars().first()
+    if not schedule_to_update: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find schedule")
+    await log(f"Schedule with id \"{schedule_to_update.id}\" was deleted", request_user.id, db)
+    await db.delete(schedule_to_update)
+    await db.commit()
+    response_cache.invalidate("scheduled_times")
+    team_calendar.invalidate()
+    return Message(message="Sucessfully deleted schedule")
+
+
+@app.get("/worked_times/{user_id}", tags=["Worked Time"], response_model=Worked_Times_Response)
+async def worked_time_get(session_token: str = Header(...), user_id: int = Path(...), amount: int = MAX_PAGE_SIZE, cursor: int = None, format: str = None, accept: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    format = stream_format(format, accept)
+    if format:
+        columns = [Worked_Times.id, Worked_Times.actualDate, Worked_Times.weekDay, Worked_Times.actualStart, Worked_Times.actualEnd, Worked_Times.user_id, Worked_Times.note, Worked_Times.active]
+        query = select(*columns).where(Worked_Times.user_id == user_id).order_by(Worked_Times.id)
+        if cursor is not None:
+            query = query.where(Worked_Times.id > cursor)
+        return stream_response(stream_rows(query), [column.key for column in columns], format, f"worked_times_{user_id}")
+    worked_times = (await db.execute(keyset(select(Worked_Times).where(Worked_Times.user_id == user_id), Worked_Times.id, cursor, amount))).scalars().all()
+    worked_times, next_cursor = split_page(worked_times, amount, lambda worked_time: worked_time.id)
+    return Worked_Times_Response(message="Succesfully got worked times", worked_times=worked_times, next_cursor=next_cursor)
+
+@app.get("/reports/timesheet", tags=["Worked Time"], response_model=Timesheet_Response)
+async def timesheet_report(session_token: str = Header(...), start: date = None, end: date = None, user_id: int = None, format: str = "json", db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder' and not request_user.id == user_id: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    if not start or not end or end < start: raise HTTPException(status.HTTP_400_BAD_REQUEST, "A valid start and end date is required")
+    query = timesheet_query(start, end, user_id)
+    if format == "csv":
+        return StreamingResponse(
+            csv_stream(timesheet_rows(stream_rows(query)), TIMESHEET_COLUMNS),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename=timesheet_{start}_{end}.csv"}
+        )
+    rows = (await db.execute(query)).mappings().all()
+    return Timesheet_Response(message="Successfully got timesheet", start=start, end=end, timesheet=[timesheet_row(row) for row in rows])
+
+@app.get("/worked_hours", tags=["Worked Time"], response_model=Worked_Hours_Response)
+async def worked_hours_get(session_token: str = Header(...), start: date = None, end: date = None, user_id: int = None, period: str = "day", db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder' and not request_user.id == user_id: raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    if not start or not end or end < start: raise HTTPException(status.HTTP_400_BAD_REQUEST, "A valid start and end date is required")
+    if period == "week":
+        model = Worked_Hours_Week
+        query = select(Worked_Hours_Weekly).where(
+            (tuple_(Worked_Hours_Weekly.isoYear, Worked_Hours_Weekly.isoWeek) >= tuple(start.isocalendar()[:2])) &
+            (tuple_(Worked_Hours_Weekly.isoYear, Worked_Hours_Weekly.isoWeek) <= tuple(end.isocalendar()[:2]))
+        ).order_by(Worked_Hours_Weekly.user_id, Worked_Hours_Weekly.isoYear, Worked_Hours_Weekly.isoWeek)
+        if user_id is not None: query = query.where(Worked_Hours_Weekly.user_id == user_id)
+    elif period == "day":
+        model = Worked_Hours_Day
+        query = select(Worked_Hours_Daily).where(
+            (Worked_Hours_Daily.day >= start) & (Worked_Hours_Daily.day <= end)
+        ).order_by(Worked_Hours_Daily.user_id, Worked_Hours_Daily.day)
+        if user_id is not None: query = query.where(Worked_Hours_Daily.user_id == user_id)
+    else:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "period must be day or week")
+    worked_hours = [model.model_validate(row) for row in (await db.execute(query)).scalars().all()]
+    return Worked_Hours_Response(message="Successfully got worked hours", worked_hours=worked_hours)
+
+@app.post("/check_in_device/{device_name}", tags=["Check-in"], response_model=Message, status_code=status.HTTP_201_CREATED)
+async def check_in_device_create(session_token: str = Header(...), device_name: str = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
     check_in_device = CheckinDeviceCode(name=device_name)
     db.add(check_in_device)
-    log(f"Created device with id \"{check_in_device.id}\"", request_user.id, db)
-    return {"message": "Succesfully created device"}, status.HTTP_201_CREATED
-
-@app.get("/check_in_device/{device_id}", tags=["Check-in"])
-def check_in_device_get(session_token: str = Header(...), device_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    check_in_device_to_get = db.query(CheckinDeviceCode).filter(CheckinDeviceCode.id == device_id).first()
-    if not check_in_device_to_get: return {"message": "Device not found"}, status.HTTP_404_NOT_FOUND
-    return {"message": "Sucessfully got device", "device": check_in_device_to_get}, status.HTTP_200_OK
-
-@app.get("/check_in_devices", tags=["Check-in"])
-def check_in_devices_get(session_token: str = Header(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    check_in_devices_to_get = db.query(CheckinDeviceCode).all()
-    if not check_in_devices_to_get: return {"message": "No devices found"}, status.HTTP_404_NOT_FOUND
-    return {"message": "Sucessfully got devices", "device": check_in_devices_to_get}, status.HTTP_200_OK
-
-@app.delete("/check_in_device/{device_id}", tags=["Check-in"])
-def check_in_device_delete(session_token: str = Header(...), device_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    check_in_device_to_get = db.query(CheckinDeviceCode).filter(CheckinDeviceCode.id == device_id).first()
-    if not check_in_device_to_get: return {"message": "Device not found"}, status.HTTP_404_NOT_FOUND
-    log(f"Device with id \"{check_in_device_to_get.id}\" was deleted", request_user.id, db)
-    db.delete(check_in_device_to_get)
-    db.commit()
-    return {"Sucessfully deleted device"}, status.HTTP_200_OK
-
-@app.get("/check_in_code", tags=["Check-in"])
-def check_out_code_get(device_code: str = Header(...), db: Session = Depends(get_db)):
-    request_device = db.query(CheckinDeviceCode).filter(CheckinDeviceCode.code == device_code).first()
-    if not request_device: return {"message": "Invalid device code"}, status.HTTP_400_BAD_REQUEST
-    return {"message": "Sucessfully got check in code", "code": CurrCheckInCode}, status.HTTP_200_OK
-
-@app.post("/check_in_out/{user_id}", tags=["Check-in"])
-def check_in(user_id: int = Path(...), check_in_code: str = Header(None), db: Session = Depends(get_db)):
-    global LastCheckInCode, GenTime, CurrCheckInCode
-    request_user = db.query(Users).filter(Users.id == user_id).first()
-    if not request_user: return {"message": "Invalid user"}, status.HTTP_400_BAD_REQUEST
-    if (check_in_code != CurrCheckInCode and not (check_in_code == LastCheckInCode and GenTime + timedelta(minutes=MinBufferTime) > datetime.now())):
-        return {"message": "Invalid check in code"}, status.HTTP_400_BAD_REQUEST
-    gen_check_in_code()
-    gen_check_in_code()
-    curr_work_time = db.query(Worked_Times).filter(
+    await db.commit()
+    response_cache.invalidate("check_in_devices")
+    await db.refresh(check_in_device)
+    await log(f"Created device with id \"{check_in_device.id}\"", request_user.id, db)
+    return Message(message="Succesfully created device")
+
+@app.get("/check_in_device/{device_id}", tags=["Check-in"], response_model=Device_Response)
+async def check_in_device_get(session_token: str = Header(...), device_id: int = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    check_in_device_to_get = (await db.execute(select(CheckinDeviceCode).where(CheckinDeviceCode.id == device_id))).scalars().first()
+    if not check_in_device_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "Device not found")
+    return Device_Response(message="Sucessfully got device", device=check_in_device_to_get)
+
+@app.get("/check_in_devices", tags=["Check-in"], response_model=Devices_Response)
+async def check_in_devices_get(session_token: str = Header(...), amount: int = MAX_PAGE_SIZE, cursor: int = None, if_none_match: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    cache_key = ("check_in_devices", amount, cursor)
+    generation = response_cache.generation
+    cached = response_cache.get(cache_key)
+    if not cached:
+        check_in_devices_to_get = (await db.execute(keyset(select(CheckinDeviceCode), CheckinDeviceCode.id, cursor, amount))).scalars().all()
+        if not check_in_devices_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "No devices found")
+        check_in_devices_to_get, next_cursor = split_page(check_in_devices_to_get, amount, lambda device: device.id)
+        cached = response_cache.put(cache_key, Devices_Response(message="Sucessfully got devices", device=check_in_devices_to_get, next_cursor=next_cursor), generation)
+    return response_cache.response(cached, if_none_match)
+
+@app.delete("/check_in_device/{device_id}", tags=["Check-in"], response_model=Message)
+async def check_in_device_delete(session_token: str = Header(...), device_id: int = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    check_in_device_to_get = (await db.execute(select(CheckinDeviceCode).where(CheckinDeviceCode.id == device_id))).scalars().first()
+    if not check_in_device_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "Device not found")
+    await log(f"Device with id \"{check_in_device_to_get.id}\" was deleted", request_user.id, db)
+    await db.delete(check_in_device_to_get)
+    await db.commit()
+    response_cache.invalidate("check_in_devices")
+    return Message(message="Sucessfully deleted device")
+
+@app.get("/presence", tags=["Check-in"], response_model=Presence_Response)
+async def presence_get(session_token: str = Header(...), version: int = None, wait: float = 0, db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if version is not None and wait > 0:
+        ## Don't hold a pooled connection while waiting
+        await db.close()
+        await presence.wait_for_change(version, wait)
+    return Presence_Response(message="Successfully got presence", **presence.snapshot())
+
+@app.get("/presence/stream", tags=["Check-in"])
+async def presence_stream(request: HttpRequest, session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    await db.close()
+
+    async def events():
+        version = None
+        while not await request.is_disconnected():
+            if version is None or await presence.wait_for_change(version, 15):
+                snapshot = presence.snapshot()
+                version = snapshot["version"]
+                yield f"event: presence\nid: {version}\ndata: {json.dumps(jsonable_encoder(snapshot))}\n\n"
+            else:
+                yield ": keepalive\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/check_in_code", tags=["Check-in"], response_model=Check_In_Code_Response)
+async def check_out_code_get(device_code: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_device = (await db.execute(select(CheckinDeviceCode).where(CheckinDeviceCode.code == device_code))).scalars().first()
+    if not request_device: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid device code")
+    code, valid_until = get_check_in_code()
+    return Check_In_Code_Response(message="Sucessfully got check in code", code=code, valid_until=datetime.fromtimestamp(valid_until, timezone.utc))
+
+@app.post("/check_in_out/batch", tags=["Check-in"], response_model=Punch_Batch_Response)
+async def check_in_batch(request: HttpRequest, device_code: str = Header(...), punches: list[Punch] = Body(...), db: AsyncSession = Depends(get_db)):
+    enforce((check_in_per_ip, client_ip(request)), (check_in_per_device, device_code))
+    request_device = (await db.execute(select(CheckinDeviceCode).where(CheckinDeviceCode.code == device_code))).scalars().first()
+    if not request_device: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid device code")
+    if len(punches) > MaxPunchBatch: raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Cannot process more than {MaxPunchBatch} punches at once")
+    user_ids = {punch.user_id for punch in punches}
+    existing_users = set((await db.execute(select(Users.id).where(Users.id.in_(user_ids)))).scalars().all())
+    active_work_times = {
+        work_time.user_id: work_time for work_time in (await db.execute(select(Worked_Times).where(
+            (Worked_Times.user_id.in_(existing_users)) & (Worked_Times.active == True)
+        ))).scalars().all()
+    }
+    ## A terminal resending punches after a network drop must not record the same work twice
+    latest_punches = {
+        work_time.user_id: work_time_end(work_time) for work_time in (await db.execute(select(Worked_Times).where(Worked_Times.id.in_(
+            select(func.max(Worked_Times.id)).where(
+                (Worked_Times.user_id.in_(existing_users)) & (Worked_Times.active == False) & (Worked_Times.actualEnd.is_not(None))
+            ).group_by(Worked_Times.user_id)
+        )))).scalars().all()
+    }
+    for user_id, work_time in active_work_times.items():
+        latest_punches[user_id] = datetime.combine(work_time.actualDate, work_time.actualStart)
+    latest_allowed = datetime.now() + timedelta(minutes=MaxPunchClockSkew)
+    results = [None] * len(punches)
+    events = []
+    for index, punch in sorted(enumerate(punches), key=lambda item: local_time(item[1].time) if item[1].time else datetime.max):
+        result = {"index": index, "user_id": punch.user_id, "time": punch.time}
+        results[index] = result
+        if punch.user_id not in existing_users:
+            result.update(status="error", message="Invalid user")
+            continue
+        if punch.time is None or local_time(punch.time) > latest_allowed:
+            result.update(status="error", message="Invalid punch time")
+            continue
+        punch_time = local_time(punch.time)
+        if punch.user_id in latest_punches and punch_time <= latest_punches[punch.user_id]:
+            result.update(status="duplicate", message="Punch is not newer than the latest recorded punch")
+            continue
+        latest_punches[punch.user_id] = punch_time
+        curr_work_time = active_work_times.get(punch.user_id)
+        if not curr_work_time:
+            new_work_time = Worked_Times(
+                actualDate=punch_time.date(),
+                weekDay=punch_time.weekday() + 1,
+                actualStart=punch_time.time(),
+                actualEnd=None,
+                user_id=punch.user_id,
+                note="",
+                active=True
+            )
+            db.add(new_work_time)
+            active_work_times[punch.user_id] = new_work_time
+            events.append(("User has checked in", punch.user_id))
+            result.update(status="checked_in", message="Sucessfully checked in")
+        else:
+            curr_work_time.actualEnd = punch_time.time()
+            curr_work_time.active = False
+            await apply_worked_time(db, curr_work_time)
+            del active_work_times[punch.user_id]
+            events.append(("User has checked out", punch.user_id))
+            result.update(status="checked_out", message="Sucessfully checked out")
+    await db.commit()
+    for user_id in user_ids & existing_users:
+        if user_id in active_work_times:
+            work_time = active_work_times[user_id]
+            presence.check_in(user_id, datetime.combine(work_time.actualDate, work_time.actualStart))
+        else:
+            presence.check_out(user_id)
+    for event, user_id in events:
+        await log(event, user_id, db)
+    return Punch_Batch_Response(message="Sucessfully processed punches", results=results)
+
+def work_time_end(work_time: Worked_Times) -> datetime:
+    end = datetime.combine(work_time.actualDate, work_time.actualEnd)
+    ## Shifts that end before they start ran past midnight
+    if work_time.actualEnd < work_time.actualStart:
+        end += timedelta(days=1)
+    return end
+
+def local_time(time: datetime) -> datetime:
+    if time.tzinfo is None: return time
+    return time.astimezone().replace(tzinfo=None)
+
+@app.post("/check_in_out/{user_id}", tags=["Check-in"], response_model=Message)
+async def check_in(request: HttpRequest, user_id: int = Path(...), check_in_code: str = Header(None), db: AsyncSession = Depends(get_db)):
+    enforce((check_in_per_ip, client_ip(request)))
+    ## The code is checked before the user's bucket, so callers without one can't lock a user out
+    if not verify_check_in_code(check_in_code):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid check in code")
+    enforce((check_in_per_user, str(user_id)))
+    request_user = (await db.execute(select(Users).where(Users.id == user_id))).scalars().first()
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid user")
+    curr_work_time = (await db.execute(select(Worked_Times).where(
         (Worked_Times.user_id == request_user.id) & (Worked_Times.active == True)
-    ).first()
+    ))).scalars().first()
     if not curr_work_time:
+        now = datetime.now()
         new_work_time = Worked_Times(
-            actualDate=datetime.now(),
-            weekDay=datetime.now().weekday() + 1,
-            actualStart=datetime.now().time(),
+            actualDate=now.date(),
+            weekDay=now.weekday() + 1,
+            actualStart=now.time(),
             actualEnd=None,
             user_id=request_user.id,
             note="",
             active=True
         )
-        log(f"User has checked in", request_user.id, db)
+        await log(f"User has checked in", request_user.id, db)
         db.add(new_work_time)
-        db.commit()
-        return {"message": "Sucessfully checked in"}, status.HTTP_200_OK
+        await db.commit()
+        presence.check_in(request_user.id, now)
+        return Message(message="Sucessfully checked in")
     else:
-        log(f"User has checked out", request_user.id, db)
+        await log(f"User has checked out", request_user.id, db)
         curr_work_time.actualEnd = datetime.now().time()
         curr_work_time.active=False
-        db.commit()
-        return {"message": "Sucessfully checked out"}, status.HTTP_200_OK
-
-def gen_check_in_code():
-    length = 16
-    global LastCheckInCode, GenTime, CurrCheckInCode
-    new_code = ''.join(random.choices(string.ascii_letters + string.digits, k=length))
-    LastCheckInCode = CurrCheckInCode
-    GenTime = datetime.now()
-    CurrCheckInCode = new_code
-
-@app.post("/request", tags=["Request"])
-def request_create(session_token: str = Header(...), request: Request = Body(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
+        await apply_worked_time(db, curr_work_time)
+        await db.commit()
+        presence.check_out(request_user.id)
+        return Message(message="Sucessfully checked out")
+
+@app.post("/request", tags=["Request"], response_model=Message, status_code=status.HTTP_201_CREATED)
+async def request_create(session_token: str = Header(...), request: Request = Body(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
     new_request = Requests(
         startDay=request.startDay,
         endDay=request.endDay,
@@ -388,96 +801,114 @@ def request_create(session_token: str = Header(...), request: Request = Body(...
         requested_by=request_user.id
     )
     db.add(new_request)
-    db.commit()
-    db.refresh(new_request)
-    log(f"Request with id \"{new_request.id}\" has been created", request_user.id, db)
-    return {"message": "request sucessfully created"}, status.HTTP_201_CREATED
-
-@app.delete("/request/{request_id}", tags=["Request"])
-def request_delete(session_token: str = Header(...), request_id: int = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    request_to_delete = db.query(Requests).filter(Requests.id == request_id).first()
-    if not request_to_delete: return {"message": "Couldn't find request"}, status.HTTP_404_NOT_FOUND
+    await db.commit()
+    await db.refresh(new_request)
+    await log(f"Request with id \"{new_request.id}\" has been created", request_user.id, db)
+    return Message(message="request sucessfully created")
+
+@app.delete("/request/{request_id}", tags=["Request"], response_model=Message)
+async def request_delete(session_token: str = Header(...), request_id: int = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    request_to_delete = (await db.execute(select(Requests).where(Requests.id == request_id))).scalars().first()
+    if not request_to_delete: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find request")
     if not request_user.role.role == 'leder':
-        if (not request_user.role.role == 'leder' and not request_user.id == request_to_delete.requested_by): 
+        if (not request_user.role.role == 'leder' and not request_user.id == request_to_delete.requested_by):
             if (not request_user.role.role == 'leder' and not request_user.id == request_to_delete.user_id):
-                return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    processed_request = db.query(Processed_Requests).filter(Processed_Requests.request_id == request_to_delete.id).first()
-    if processed_request: return {"message": "Can't delete processed request"}, status.HTTP_405_METHOD_NOT_ALLOWED
-    log(f"Request with id \"{request_to_delete.id}\" has been deleted", request_user.id, db)
-    db.delete(request_to_delete)
-    db.commit()
-    return {"message": "Successfully deleted request"}, status.HTTP_200_OK
-
-@app.get("/request/{request_id}&{get_processed}", tags=["Request"])
-def request_get(session_token: str = Header(...), request_id: int = Path(...), get_processed: bool = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    request_to_get = None
+                raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    processed_request = (await db.execute(select(Processed_Requests).where(Processed_Requests.request_id == request_to_delete.id))).scalars().first()
+    if processed_request: raise HTTPException(status.HTTP_405_METHOD_NOT_ALLOWED, "Can't delete processed request")
+    await log(f"Request with id \"{request_to_delete.id}\" has been deleted", request_user.id, db)
+    await db.delete(request_to_delete)
+    await db.commit()
+    return Message(message="Successfully deleted request")
+
+@app.get("/request/{request_id}&{get_processed}", tags=["Request"], response_model=Request_Response)
+async def request_get(session_token: str = Header(...), request_id: int = Path(...), get_processed: bool = Path(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    row = None
     if get_processed:
-        request_to_get = db.query(Requests).outerjoin(Processed_Requests).filter(Requests.id == request_id).first()
+        row = (await db.execute(select(Requests, Processed_Requests).outerjoin(Processed_Requests).where(Requests.id == request_id))).first()
     else:
-        request_to_get = db.query(Requests).outerjoin(Processed_Requests).filter((Processed_Requests.id.is_(None)) & (Requests.id == request_id)).first()
-    if not request_to_get: return {"message": "Couldn't find request"}, status.HTTP_404_NOT_FOUND
+        row = (await db.execute(select(Requests, Processed_Requests).outerjoin(Processed_Requests).where((Processed_Requests.id.is_(None)) & (Requests.id == request_id)))).first()
+    if not row: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find request")
+    request_to_get, processed = row
     if not request_user.role.role == 'leder':
-        if (not request_user.role.role == 'leder' and not request_user.id == request_to_get.requested_by): 
+        if (not request_user.role.role == 'leder' and not request_user.id == request_to_get.requested_by):
             if (not request_user.role.role == 'leder' and not request_user.id == request_to_get.user_id):
-                return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    processed = db.query(Processed_Requests).filter(Processed_Requests.request_id == request_to_get.id).first()
-    return {"message": "Successfully got request", "request": request_to_get, "processed": processed}, 200
-
-@app.get("/requests/{user_id}&{get_processed}", tags=["Request"])
-def user_requests_get(session_token: str = Header(...), user_id: int = Path(...), get_processed: bool = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
+                raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    return Request_Response(message="Successfully got request", request=request_to_get, processed=processed)
+
+REQUEST_STREAM_COLUMNS = [
+    Requests.id, Requests.reason, Requests.startDay, Requests.endDay, Requests.type_id, Requests.user_id, Requests.requested_by,
+    Processed_Requests.accepted, Processed_Requests.reason.label("processed_reason"), Processed_Requests.processed_at, Processed_Requests.admin_id,
+]
+
+def requests_stream(format: str, condition, get_processed: bool, cursor: int | None) -> StreamingResponse:
+    ## One flat row per request, processed columns are empty while it's pending
+    query = select(*REQUEST_STREAM_COLUMNS).select_from(Requests).outerjoin(Processed_Requests).where(condition).order_by(Requests.id)
+    if not get_processed:
+        query = query.where(Processed_Requests.id.is_(None))
+    if cursor is not None:
+        query = query.where(Requests.id > cursor)
+    return stream_response(stream_rows(query), [column.key for column in REQUEST_STREAM_COLUMNS], format, "requests")
+
+@app.get("/requests/{user_id}&{get_processed}", tags=["Request"], response_model=Requests_Response)
+async def user_requests_get(session_token: str = Header(...), user_id: int = Path(...), get_processed: bool = Path(...), amount: int = MAX_PAGE_SIZE, cursor: int = None, format: str = None, accept: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    format = stream_format(format, accept)
+    if format:
+        return requests_stream(format, (Requests.user_id == user_id) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder'), get_processed, cursor)
     requests_to_get = None
     if get_processed:
-        requests_to_get = db.query(Requests).outerjoin(Processed_Requests).filter((Requests.user_id == user_id) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')).all()
+        requests_to_get = (await db.execute(keyset(select(Requests, Processed_Requests).outerjoin(Processed_Requests).where((Requests.user_id == user_id) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')), Requests.id, cursor, amount))).all()
     else:
-        requests_to_get = db.query(Requests).outerjoin(Processed_Requests).filter((Processed_Requests.id.is_(None)) & (Requests.user_id == user_id) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')).all()
-    if not requests_to_get: return {"message": "Couldn't find request"}, status.HTTP_404_NOT_FOUND
-    
-    requests_with_processed = []
-    for request in requests_to_get:
-        processed = db.query(Processed_Requests).filter(Processed_Requests.request_id == request.id).first()
-        requests_with_processed.append({
-            "request": request,
-            "processed": processed
-        })
-    
-    return {"message": "Successfully got requests", "requests": requests_with_processed}, status.HTTP_200_OK
-    
-
-@app.get("/requests/{get_processed}", tags=["Request"])
-def requests_get(session_token: str = Header(...), get_processed: bool = Path(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
+        requests_to_get = (await db.execute(keyset(select(Requests, Processed_Requests).outerjoin(Processed_Requests).where((Processed_Requests.id.is_(None)) & (Requests.user_id == user_id) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')), Requests.id, cursor, amount))).all()
+    if not requests_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find request")
+    requests_to_get, next_cursor = split_page(requests_to_get, amount, lambda row: row[0].id)
+
+    requests_with_processed = [
+        Request_With_Processed(
+            request=request,
+            processed=processed
+        ) for request, processed in requests_to_get]
+
+    return Requests_Response(message="Successfully got requests", requests=requests_with_processed, next_cursor=next_cursor)
+
+
+@app.get("/requests/{get_processed}", tags=["Request"], response_model=Requests_Response)
+async def requests_get(session_token: str = Header(...), get_processed: bool = Path(...), amount: int = MAX_PAGE_SIZE, cursor: int = None, format: str = None, accept: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    format = stream_format(format, accept)
+    if format:
+        return requests_stream(format, or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder'), get_processed, cursor)
     requests_to_get = None
     if get_processed:
-        requests_to_get = db.query(Requests).outerjoin(Processed_Requests).filter(or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')).all()
+        requests_to_get = (await db.execute(keyset(select(Requests, Processed_Requests).outerjoin(Processed_Requests).where(or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')), Requests.id, cursor, amount))).all()
     else:
-        requests_to_get = db.query(Requests).outerjoin(Processed_Requests).filter((Processed_Requests.id.is_(None)) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')).all()
-    if not requests_to_get: return {"message": "Couldn't find request"}, status.HTTP_404_NOT_FOUND
-
-    requests_with_processed = []
-    for request in requests_to_get:
-        processed = db.query(Processed_Requests).filter(Processed_Requests.request_id == request.id).first()
-        requests_with_processed.append({
-            "request": request,
-            "processed": processed
-        })
-    
-    return {"message": "Successfully got requests", "requests": requests_with_processed}, status.HTTP_200_OK
-    
-
-@app.post("/process_request", tags=["Request"])
-def process_request(session_token: str = Header(...), process_request: Process_Request = Body(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    if not request_user.role.role == 'leder': return {"message": "Invalid Permissions"}, status.HTTP_401_UNAUTHORIZED
-    process_request_check = db.query(Processed_Requests).filter(Processed_Requests.request_id == process_request.request_id).first()
-    if process_request_check: return {"message": "Cannot process already processed request"}, status.HTTP_400_BAD_REQUEST
+        requests_to_get = (await db.execute(keyset(select(Requests, Processed_Requests).outerjoin(Processed_Requests).where((Processed_Requests.id.is_(None)) & or_(or_(Requests.user_id == request_user.id, Requests.requested_by == request_user.id), request_user.role.role == 'leder')), Requests.id, cursor, amount))).all()
+    if not requests_to_get: raise HTTPException(status.HTTP_404_NOT_FOUND, "Couldn't find request")
+    requests_to_get, next_cursor = split_page(requests_to_get, amount, lambda row: row[0].id)
+
+    requests_with_processed = [
+        Request_With_Processed(
+            request=request,
+            processed=processed
+        ) for request, processed in requests_to_get]
+
+    return Requests_Response(message="Successfully got requests", requests=requests_with_processed, next_cursor=next_cursor)
+
+
+@app.post("/process_request", tags=["Request"], response_model=Message, status_code=status.HTTP_201_CREATED)
+async def process_request(session_token: str = Header(...), process_request: Process_Request = Body(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    process_request_check = (await db.execute(select(Processed_Requests).where(Processed_Requests.request_id == process_request.request_id))).scalars().first()
+    if process_request_check: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cannot process already processed request")
     processed_request = Processed_Requests(
         request_id=process_request.request_id,
         accepted=process_request.accepted,
@@ -485,30 +916,82 @@ def process_request(session_token: str = Header(...), process_request: Process_R
         admin_id=request_user.id
     )
     db.add(processed_request)
-    db.commit()
-    db.refresh(processed_request)
-    log(f"Request with id \"{processed_request}\" has been processed", request_user.id, db)
-    return {"message": "Successfully processed request"}, status.HTTP_201_CREATED
-
-@app.get("/request_types", tags=["Request"])
-def request_types_get(session_token: str = Header(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    request_types = db.query(Request_Types).all()
-    return {"message": "Successfully got request types", "request_types": request_types}, status.HTTP_200_OK
-
-@app.get("/roles", tags=["Roles"])
-def roles_get(session_token: str = Header(...), db: Session = Depends(get_db)):
-    request_user = validate_session(session_token, db)
-    if not request_user: return {"message": "Invalid session"}, status.HTTP_400_BAD_REQUEST
-    roles = db.query(Roles).all()
-    return {"message": "Successfully got roles", "roles": roles}, status.HTTP_200_OK
-
-
-def log(event: str, user_id: int, db: Session):
-    new_log = Logs(
-        event=event,
-        user_id=user_id
-    )
-    db.add(new_log)
-    db.commit()
\ No newline at end of file
+    await db.commit()
+    await db.refresh(processed_request)
+    if processed_request.accepted:
+        team_calendar.invalidate()
+    await log(f"Request with id \"{processed_request.request_id}\" has been processed", request_user.id, db)
+    return Message(message="Successfully processed request")
+
+@app.get("/request_types", tags=["Request"], response_model=Request_Types_Response)
+async def request_types_get(session_token: str = Header(...), if_none_match: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    generation = response_cache.generation
+    cached = response_cache.get(("request_types",))
+    if not cached:
+        request_types = (await db.execute(select(Request_Types))).scalars().all()
+        cached = response_cache.put(("request_types",), Request_Types_Response(message="Successfully got request types", request_types=request_types), generation)
+    return response_cache.response(cached, if_none_match)
+
+@app.get("/roles", tags=["Roles"], response_model=Roles_Response)
+async def roles_get(session_token: str = Header(...), if_none_match: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    generation = response_cache.generation
+    cached = response_cache.get(("roles",))
+    if not cached:
+        roles = (await db.execute(select(Roles))).scalars().all()
+        cached = response_cache.put(("roles",), Roles_Response(message="Successfully got roles", roles=roles), generation)
+    return response_cache.response(cached, if_none_match)
+
+@app.get("/logs", tags=["Logs"], response_model=Logs_Response)
+async def logs_get(session_token: str = Header(...), user_id: int = None, start: datetime = None, end: datetime = None, amount: int = MAX_PAGE_SIZE, cursor: int = None, format: str = None, accept: str = Header(None), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    start, end = as_utc(start), as_utc(end)
+    filters = []
+    if user_id is not None:
+        filters.append(Logs.user_id == user_id)
+    if start is not None:
+        filters.append(Logs.time >= start)
+    if end is not None:
+        filters.append(Logs.time < end)
+    format = stream_format(format, accept)
+    if format:
+        columns = [Logs.id, Logs.event, Logs.time, Logs.user_id]
+        return stream_response(log_archive.stream(select(*columns).where(*filters), user_id, start, end, cursor), [column.key for column in columns], format, "logs")
+    logs = (await db.execute(keyset(select(Logs).where(*filters), Logs.id, cursor, amount))).scalars().all()
+    ## Archived rows are older, the live rows only fill the page once the archives run out
+    if log_archive.has_archives():
+        archived = await asyncio.to_thread(log_archive.read, user_id, start, end, cursor, page_size(amount) + 1)
+        logs = merge_logs([Log(**row) for row in archived], logs)
+    logs, next_cursor = split_page(logs, amount, lambda log: log.id)
+    return Logs_Response(message="Successfully got logs", logs=logs, next_cursor=next_cursor)
+
+def component_stats() -> dict[str, dict]:
+    return {
+        "session_cache": session_cache.stats(),
+        "audit_log": audit_log.stats(),
+        "hash_pool": hash_pool.stats(),
+        "response_cache": response_cache.stats(),
+        "session_tokens": session_tokens.stats(),
+        "log_archive": log_archive.stats(),
+        "team_calendar": team_calendar.stats(),
+        "rate_limit": ratelimit.stats(),
+    }
+
+@app.get("/stats", tags=["Stats"], response_model=Stats_Response)
+async def stats_get(session_token: str = Header(...), db: AsyncSession = Depends(get_db)):
+    request_user = await validate_session(session_token, db)
+    if not request_user: raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid session")
+    if not request_user.role.role == 'leder': raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid Permissions")
+    return Stats_Response(message="Successfully got stats", **component_stats())
+
+@app.get("/metrics", tags=["Stats"], response_class=PlainTextResponse)
+async def metrics_get():
+    return metrics.render(component_stats())
+
+async def log(event: str, user_id: int, db: AsyncSession):
+    await audit_log.log(event, user_id, db)
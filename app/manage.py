@@ -0,0 +1,35 @@
+import argparse, asyncio
+from .database import AsyncSessionLocal, engine
+from .migrations import SCHEMA_VERSION, schema_version, setup
+from .logarchive import log_archive
+
+async def archive_logs() -> int:
+    async with AsyncSessionLocal() as db:
+        return await log_archive.archive(db)
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.manage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Create missing tables and indexes and seed default data")
+    migrate_parser.add_argument("--force", action="store_true", help="Run even if the schema version is current")
+    commands.add_parser("version", help="Show the database and code schema versions")
+    archive_parser = commands.add_parser("archive-logs", help="Move log rows older than the retention period into the archive")
+    archive_parser.add_argument("--days", type=int, help="Retention in days, defaults to LOG_RETENTION_DAYS")
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        setup(engine, force=args.force)
+        print(f"Database is at schema version {SCHEMA_VERSION}")
+    elif args.command == "version":
+        print(f"Database schema version: {schema_version(engine) or 'none'}")
+        print(f"Code schema version: {SCHEMA_VERSION}")
+    elif args.command == "archive-logs":
+        if args.days is not None:
+            log_archive.retention_days = args.days
+        if log_archive.retention_days <= 0:
+            parser.error("Set LOG_RETENTION_DAYS or --days")
+        setup(engine)
+        print(f"Archived {asyncio.run(archive_logs())} log rows to {log_archive.directory}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session
+from .database import Base
+from . import models
+
+## Bump whenever tables, columns, indexes or seed data change
+SCHEMA_VERSION = "2"
+AUTO_MIGRATE = os.getenv("AUTO_MIGRATE", "1") == "1"
+
+def create_missing_indexes(engine):
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=engine)
+
+def migrate(engine):
+    Base.metadata.create_all(bind=engine)
+    create_missing_indexes(engine)
+
+def schema_version(engine) -> str | None:
+    with engine.connect() as connection:
+        if not inspect(connection).has_table(models.Settings.__tablename__):
+            return None
+        return connection.execute(select(models.Settings.value).where(models.Settings.key == "schema_version")).scalar()
+
+def setup(engine, run_migrations: bool = True, force: bool = False):
+    current_version = schema_version(engine)
+    if force or current_version != SCHEMA_VERSION:
+        if not run_migrations:
+            raise RuntimeError(f"Database schema is at version {current_version}, expected {SCHEMA_VERSION}. Run `python -m app.manage migrate`")
+        migrate(engine)
+        with Session(engine) as session:
+            models.seed_defaults(session)
+            models.set_setting(session, "schema_version", SCHEMA_VERSION)
+    with Session(engine) as session:
+        models.load_settings(session)
@@ -1,7 +1,9 @@
 import random 
+import secrets
 import string
 from datetime import timezone
-from sqlalchemy import String, Boolean, Integer, ForeignKey, DateTime, func, Date, Time, select
+from sqlalchemy import String, Boolean, Integer, BigInteger, ForeignKey, DateTime, func, Date, Time, select, Index
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime, timedelta
 from .database import Base
@@ -51,11 +53,12 @@ class Sessions(Base):
 	__tablename__ = "sessions"
 	
 	id: Mapped[int] = mapped_column(primary_key=True)
-	session_token: Mapped[str] = mapped_column(String(32), default=lambda: ''.join(random.choices(string.ascii_letters + string.digits, k=32)))
+	session_token: Mapped[str] = mapped_column(String(32), default=lambda: ''.join(random.choices(string.ascii_letters + string.digits, k=32)), index=True)
 	activeUntil: Mapped[datetime] = mapped_column(
 		DateTime(timezone=True),
 		default=lambda: datetime.now(timezone.utc) + timedelta(days=1),
-		nullable=False
+		nullable=False,
+		index=True
 	)
 	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
 	user: Mapped["Users"] = relationship(back_populates="sessions")
@@ -65,7 +68,7 @@ class CheckinDeviceCode(Base):
 
 	id: Mapped[int] = mapped_column(primary_key=True)
 	name: Mapped[str] = mapped_column(String(50))
-	code: Mapped[str] = mapped_column(String(32), default=lambda: ''.join(random.choices(string.ascii_letters + string.digits, k=32)))
+	code: Mapped[str] = mapped_column(String(32), default=lambda: ''.join(random.choices(string.ascii_letters + string.digits, k=32)), index=True)
   
 class Scheduled_Times(Base):
 	__tablename__ = "scheduled_times"
@@ -74,7 +77,7 @@ class Scheduled_Times(Base):
 	weekDay: Mapped[int] = mapped_column(Integer())
 	startTime: Mapped[datetime.time] = mapped_column(Time())
 	endTime: Mapped[datetime.time] = mapped_column(Time())
-	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
 	user: Mapped["Users"] = relationship(back_populates="scheduled_times")
 
 	inactive: Mapped[bool] = mapped_column(Boolean())
@@ -82,6 +85,9 @@ class Scheduled_Times(Base):
 
 class Worked_Times(Base):
 	__tablename__ = "worked_times"
+	__table_args__ = (
+		Index("ix_worked_times_user_id_active", "user_id", "active"),
+	)
 
 	id: Mapped[int] = mapped_column(primary_key=True)
 	actualDate: Mapped[datetime.date] = mapped_column(Date())
@@ -96,14 +102,35 @@ class Worked_Times(Base):
 
 	user: Mapped["Users"] = relationship(back_populates="worked_times")
 
+class Worked_Hours_Daily(Base):
+	__tablename__ = "worked_hours_daily"
+
+	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+	day: Mapped[datetime.date] = mapped_column(Date(), primary_key=True)
+	minutes: Mapped[int] = mapped_column(Integer(), default=0)
+	punches: Mapped[int] = mapped_column(Integer(), default=0)
+
+class Worked_Hours_Weekly(Base):
+	__tablename__ = "worked_hours_weekly"
+
+	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+	isoYear: Mapped[int] = mapped_column(Integer(), primary_key=True)
+	isoWeek: Mapped[int] = mapped_column(Integer(), primary_key=True)
+	minutes: Mapped[int] = mapped_column(Integer(), default=0)
+	punches: Mapped[int] = mapped_column(Integer(), default=0)
+
 class Logs(Base):
 	__tablename__ = "logs"
+	__table_args__ = (
+		Index("ix_logs_user_id_time", "user_id", "time"),
+	)
 
 	id: Mapped[int] = mapped_column(primary_key=True)
 	event: Mapped[str] = mapped_column(String(500))
 	time: Mapped[datetime] = mapped_column(
 		DateTime(timezone=True),
-		server_default=func.now()
+		server_default=func.now(),
+		index=True
 	)
 	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
 	user: Mapped["Users"] = relationship(back_populates="logs")
@@ -123,8 +150,8 @@ class Requests(Base):
 	startDay: Mapped[datetime.time] = mapped_column(DateTime(timezone=True))
 	endDay: Mapped[datetime.time] = mapped_column(DateTime(timezone=True),)
 	type_id: Mapped[int] = mapped_column(ForeignKey("request_types.id"))
-	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
-	requested_by: Mapped[int] = mapped_column(ForeignKey("users.id"))
+	user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+	requested_by: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
 
 	type: Mapped["Request_Types"] = relationship(back_populates="requests")
 
@@ -149,7 +176,7 @@ class Processed_Requests(Base):
 
 	id: Mapped[int] = mapped_column(primary_key=True)
 
-	request_id: Mapped[int] = mapped_column(ForeignKey("requests.id"))
+	request_id: Mapped[int] = mapped_column(ForeignKey("requests.id"), index=True)
 	accepted: Mapped[bool] = mapped_column(Boolean())
 	reason: Mapped[str] = mapped_column(String(500))
 	processed_at: Mapped[datetime] = mapped_column(
@@ -165,11 +192,52 @@ class Processed_Requests(Base):
 		foreign_keys=[admin_id]
 	)
 
+class Settings(Base):
+	__tablename__ = "settings"
+
+	id: Mapped[int] = mapped_column(primary_key=True)
+	key: Mapped[str] = mapped_column(String(50), unique=True)
+	value: Mapped[str] = mapped_column(String(255))
+
+class Session_Revocations(Base):
+	__tablename__ = "session_revocations"
+
+	id: Mapped[int] = mapped_column(primary_key=True)
+	## No foreign key, revocations have to outlive deleted users
+	user_id: Mapped[int] = mapped_column(Integer())
+	## Set for a single revoked token, empty when every token issued before revokedAt is revoked
+	token_id: Mapped[str | None] = mapped_column(String(32), nullable=True)
+	revokedAt: Mapped[int] = mapped_column(BigInteger(), index=True)
+	activeUntil: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
+def get_or_create_setting(session, key, default):
+	setting = session.execute(select(Settings).where(Settings.key == key)).scalars().first()
+	if setting:
+		return setting.value
+	try:
+		session.add(Settings(key=key, value=default()))
+		session.commit()
+	except IntegrityError:
+		## Another worker created it first
+		session.rollback()
+	return session.execute(select(Settings).where(Settings.key == key)).scalars().one().value
+
+
+def set_setting(session, key, value):
+	setting = session.execute(select(Settings).where(Settings.key == key)).scalars().first()
+	if setting:
+		setting.value = value
+	else:
+		session.add(Settings(key=key, value=value))
+	session.commit()
+
+def is_empty(session, model):
+	return session.execute(select(model.id).limit(1)).first() is None
 
 def seed_defaults(session):
 	# Roles
-	existing_roles = session.execute(select(Roles)).scalars().all()
-	if not existing_roles:
+	if is_empty(session, Roles):
 		session.add_all([
 			Roles(role="leder"),
 			Roles(role="medarbejder"),
@@ -177,8 +245,7 @@ def seed_defaults(session):
 	session.commit()
 
 	# Request Types
-	existing_types = session.execute(select(Request_Types)).scalars().all()
-	if not existing_types:
+	if is_empty(session, Request_Types):
 		session.add_all([
 			Request_Types(type_name="ferie"),
 			Request_Types(type_name="sygdom"),
@@ -188,18 +255,22 @@ def seed_defaults(session):
 		])
 	session.commit()
 	
-	existing_users = session.execute(select(Users)).scalars().all()
-	if not existing_users:
+	if is_empty(session, Users):
 		role_leder = session.execute(select(Roles).where(Roles.role == "leder")).scalars().first()
 
 		session.add_all([
 			Users(username="Admin", name="Admin", role=role_leder, hashed_pass=get_password_hash("1234"))
 		])
 
-	existing_devices = session.execute(select(CheckinDeviceCode)).scalars().all()
-	if not existing_devices:
+	if is_empty(session, CheckinDeviceCode):
 		session.add_all([
 			CheckinDeviceCode(name="ForcedCheckIn", code="A8Tt5OK0nb4TNFY5ttbcw4HIVVeNi1Lq")
 		])
 
-	session.commit()
\ No newline at end of file
+	session.commit()
+
+def load_settings(session):
+	if not CHECK_IN_SECRET:
+		set_check_in_secret(get_or_create_setting(session, "check_in_secret", lambda: secrets.token_hex(32)))
+	if not SESSION_SECRET:
+		set_session_secret(get_or_create_setting(session, "session_secret", lambda: secrets.token_hex(32)))
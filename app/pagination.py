@@ -0,0 +1,19 @@
+import os
+from sqlalchemy import Select
+
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "100"))
+
+def page_size(amount: int) -> int:
+    return max(1, min(amount, MAX_PAGE_SIZE))
+
+def keyset(query: Select, column, cursor: int | None, amount: int) -> Select:
+    if cursor is not None:
+        query = query.where(column > cursor)
+    return query.order_by(column).limit(page_size(amount) + 1)
+
+def split_page(rows, amount: int, key):
+    amount = page_size(amount)
+    if len(rows) > amount:
+        rows = rows[:amount]
+        return rows, key(rows[-1])
+    return rows, None
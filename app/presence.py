@@ -0,0 +1,58 @@
+import asyncio, os
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Worked_Times
+
+PRESENCE_RECONCILE_INTERVAL = int(os.getenv("PRESENCE_RECONCILE_INTERVAL", "30"))
+PRESENCE_MAX_WAIT = 60
+
+class PresenceIndex:
+    def __init__(self):
+        self.version = 0
+        self._present: dict[int, datetime] = {}
+        self._changed: asyncio.Event | None = None
+
+    async def load(self, db: AsyncSession):
+        rows = (await db.execute(
+            select(Worked_Times.user_id, Worked_Times.actualDate, Worked_Times.actualStart).where(Worked_Times.active == True)
+        )).all()
+        present = {user_id: datetime.combine(actualDate, actualStart) for user_id, actualDate, actualStart in rows}
+        if present != self._present:
+            self._present = present
+            self._notify()
+
+    def check_in(self, user_id: int, since: datetime):
+        if self._present.get(user_id) != since:
+            self._present[user_id] = since
+            self._notify()
+
+    def check_out(self, user_id: int):
+        if self._present.pop(user_id, None) is not None:
+            self._notify()
+
+    def snapshot(self) -> dict:
+        return {
+            "version": self.version,
+            "users": [{"user_id": user_id, "since": since} for user_id, since in sorted(self._present.items())],
+        }
+
+    async def wait_for_change(self, version: int, timeout: float) -> bool:
+        if version != self.version:
+            return True
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._changed.wait(), min(timeout, PRESENCE_MAX_WAIT))
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def _notify(self):
+        self.version += 1
+        if self._changed is not None:
+            ## Waiters hold the old event, so setting it wakes exactly the current waiters
+            changed, self._changed = self._changed, asyncio.Event()
+            changed.set()
+
+presence = PresenceIndex()
@@ -0,0 +1,109 @@
+import math, os, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from fastapi import HTTPException, status
+from .security import HASH_CONCURRENCY
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+## Buckets are "<calls>/<seconds>", a full bucket allows a burst of <calls>
+LOGIN_RATE_PER_IP = os.getenv("LOGIN_RATE_PER_IP", "30/60")
+LOGIN_RATE_PER_USERNAME = os.getenv("LOGIN_RATE_PER_USERNAME", "10/60")
+CHECK_IN_RATE_PER_IP = os.getenv("CHECK_IN_RATE_PER_IP", "300/60")
+CHECK_IN_RATE_PER_USER = os.getenv("CHECK_IN_RATE_PER_USER", "10/60")
+CHECK_IN_RATE_PER_DEVICE = os.getenv("CHECK_IN_RATE_PER_DEVICE", "60/60")
+LOGIN_MAX_IN_FLIGHT = int(os.getenv("LOGIN_MAX_IN_FLIGHT", str(HASH_CONCURRENCY * 4)))
+RATE_LIMIT_MAX_KEYS = 100000
+
+def parse_rate(rate: str) -> tuple[float, float]:
+    calls, seconds = rate.split("/")
+    return float(calls), float(seconds)
+
+class TokenBucketLimiter:
+    def __init__(self, rate: str, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.capacity, period = parse_rate(rate)
+        self.refill_rate = self.capacity / period
+        self.max_keys = max_keys
+        self.admitted = 0
+        self.rejected = 0
+        ## key -> (tokens, updated), a bucket dropped from the LRU starts full again
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.capacity
+        tokens, updated = bucket
+        return min(self.capacity, tokens + (now - updated) * self.refill_rate)
+
+    def retry_after(self, key: str, now: float) -> float:
+        tokens = self.tokens(key, now)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.refill_rate
+
+    def take(self, key: str, now: float):
+        self._buckets[key] = (self.tokens(key, now) - 1, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        self.admitted += 1
+
+    def stats(self) -> dict:
+        return {"admitted": self.admitted, "rejected": self.rejected, "keys": len(self._buckets)}
+
+class InFlightLimit:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    @contextmanager
+    def enter(self):
+        if RATE_LIMIT_ENABLED and self.in_flight >= self.limit:
+            self.rejected += 1
+            raise too_many_requests(1)
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "admitted": self.admitted, "rejected": self.rejected}
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "Too many requests, try again later", headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+def enforce(*checks: tuple[TokenBucketLimiter, str]):
+    ## Every bucket is checked before any is drawn from, so a rejected call costs nothing
+    if not RATE_LIMIT_ENABLED:
+        return
+    now = time.monotonic()
+    retry_after = 0.0
+    for limiter, key in checks:
+        wait = limiter.retry_after(key, now)
+        if wait > 0:
+            limiter.rejected += 1
+            retry_after = max(retry_after, wait)
+    if retry_after > 0:
+        raise too_many_requests(retry_after)
+    for limiter, key in checks:
+        limiter.take(key, now)
+
+login_per_ip = TokenBucketLimiter(LOGIN_RATE_PER_IP)
+login_per_username = TokenBucketLimiter(LOGIN_RATE_PER_USERNAME)
+check_in_per_ip = TokenBucketLimiter(CHECK_IN_RATE_PER_IP)
+check_in_per_user = TokenBucketLimiter(CHECK_IN_RATE_PER_USER)
+check_in_per_device = TokenBucketLimiter(CHECK_IN_RATE_PER_DEVICE)
+login_verifications = InFlightLimit(LOGIN_MAX_IN_FLIGHT)
+
+def stats() -> dict:
+    limiters = {
+        "login_ip": login_per_ip,
+        "login_username": login_per_username,
+        "check_in_ip": check_in_per_ip,
+        "check_in_user": check_in_per_user,
+        "check_in_device": check_in_per_device,
+        "login_verifications": login_verifications,
+    }
+    return {"enabled": RATE_LIMIT_ENABLED} | {f"{name}_{key}": value for name, limiter in limiters.items() for key, value in limiter.stats().items()}
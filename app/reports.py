@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+from sqlalchemy import Integer, Select, case, func, or_, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from .models import Scheduled_Times, Users, Worked_Times
+
+TIMESHEET_COLUMNS = ["user_id", "username", "name", "punches", "worked_hours", "scheduled_hours", "overtime_hours"]
+
+class time_seconds(FunctionElement):
+    ## Whole seconds since midnight for a TIME column, fractions are truncated like in SQLite
+    type = Integer()
+    name = "time_seconds"
+    inherit_cache = True
+
+@compiles(time_seconds)
+def compile_time_seconds(element, compiler, **kw):
+    return "CAST(FLOOR(EXTRACT(EPOCH FROM %s)) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+@compiles(time_seconds, "sqlite")
+def compile_time_seconds_sqlite(element, compiler, **kw):
+    return "CAST(strftime('%%s', '1970-01-01 ' || %s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+def duration_seconds(start, end):
+    ## Shifts that end before they start ran past midnight
+    start_seconds = time_seconds(start)
+    end_seconds = time_seconds(end)
+    return case(
+        (end_seconds < start_seconds, end_seconds - start_seconds + 86400),
+        else_=end_seconds - start_seconds
+    )
+
+def weekday_counts(start: date, end: date) -> dict[int, int]:
+    days = (end - start).days + 1
+    counts = {weekDay: days // 7 for weekDay in range(1, 8)}
+    for offset in range(days % 7):
+        counts[(start + timedelta(days=offset)).weekday() + 1] += 1
+    return counts
+
+def timesheet_query(start: date, end: date, user_id: int | None = None) -> Select:
+    worked = select(
+        Worked_Times.user_id,
+        func.sum(duration_seconds(Worked_Times.actualStart, Worked_Times.actualEnd)).label("worked_seconds"),
+        func.count().label("punches"),
+    ).where(
+        (Worked_Times.active == False) & (Worked_Times.actualEnd.is_not(None)) &
+        (Worked_Times.actualDate >= start) & (Worked_Times.actualDate <= end)
+    ).group_by(Worked_Times.user_id)
+
+    days_per_weekday = case(weekday_counts(start, end), value=Scheduled_Times.weekDay, else_=0)
+    scheduled = select(
+        Scheduled_Times.user_id,
+        func.sum(duration_seconds(Scheduled_Times.startTime, Scheduled_Times.endTime) * days_per_weekday).label("scheduled_seconds"),
+    ).where(
+        or_(Scheduled_Times.inactive == False, Scheduled_Times.inactive.is_(None))
+    ).group_by(Scheduled_Times.user_id)
+
+    if user_id is not None:
+        worked = worked.where(Worked_Times.user_id == user_id)
+        scheduled = scheduled.where(Scheduled_Times.user_id == user_id)
+    worked = worked.subquery()
+    scheduled = scheduled.subquery()
+
+    worked_seconds = func.coalesce(worked.c.worked_seconds, 0)
+    scheduled_seconds = func.coalesce(scheduled.c.scheduled_seconds, 0)
+    query = select(
+        Users.id.label("user_id"),
+        Users.username,
+        Users.name,
+        func.coalesce(worked.c.punches, 0).label("punches"),
+        worked_seconds.label("worked_seconds"),
+        scheduled_seconds.label("scheduled_seconds"),
+        (worked_seconds - scheduled_seconds).label("overtime_seconds"),
+    ).outerjoin(worked, worked.c.user_id == Users.id).outerjoin(scheduled, scheduled.c.user_id == Users.id).order_by(Users.id)
+    if user_id is not None:
+        query = query.where(Users.id == user_id)
+    return query
+
+def timesheet_row(row: dict) -> dict:
+    return {
+        "user_id": row["user_id"],
+        "username": row["username"],
+        "name": row["name"],
+        "punches": row["punches"],
+        "worked_hours": round(row["worked_seconds"] / 3600, 2),
+        "scheduled_hours": round(row["scheduled_seconds"] / 3600, 2),
+        "overtime_hours": round(row["overtime_seconds"] / 3600, 2),
+    }
+
+async def timesheet_rows(rows):
+    async for row in rows:
+        yield timesheet_row(row)
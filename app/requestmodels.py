@@ -29,4 +29,9 @@ class Request:
 class Process_Request:
     request_id: int = -1
     accepted: bool = None
-    reason: str|None = None
\ No newline at end of file
+    reason: str|None = None
+
+@dataclass
+class Punch:
+    user_id: int = -1
+    time: datetime|None = None
@@ -0,0 +1,51 @@
+import hashlib, os
+from dataclasses import dataclass
+from fastapi import Response
+from pydantic import BaseModel
+from .ttlcache import TTLCache
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "60"))
+CACHE_CONTROL = "private, no-cache"
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+
+class ResponseCache:
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: int = RESPONSE_CACHE_TTL):
+        self.not_modified = 0
+        self._entries = TTLCache(max_size, ttl)
+
+    @property
+    def generation(self) -> int:
+        return self._entries.generation
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        return self._entries.get(key)
+
+    def put(self, key: tuple, content: BaseModel, generation: int | None = None) -> CachedResponse:
+        body = content.model_dump_json().encode()
+        entry = CachedResponse(body, f'"{hashlib.sha1(body).hexdigest()}"')
+        ## Still served to this caller, but not cached if an invalidation came in since generation was read
+        self._entries.put(key, entry, generation=generation)
+        return entry
+
+    def invalidate(self, namespace: str):
+        self._entries.invalidate(lambda key, entry: key[0] == namespace)
+
+    def response(self, entry: CachedResponse, if_none_match: str | None) -> Response:
+        headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+        if if_none_match and (if_none_match.strip() == "*" or entry.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type="application/json", headers=headers)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats() | {"not_modified": self.not_modified}
+
+response_cache = ResponseCache()
@@ -0,0 +1,211 @@
+from datetime import date, datetime, time
+from pydantic import BaseModel, ConfigDict
+
+class OrmModel(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+class Message(BaseModel):
+    message: str
+
+class Role(OrmModel):
+    id: int
+    role: str
+
+class Request_Type(OrmModel):
+    id: int
+    type_name: str
+
+class User_Info(OrmModel):
+    id: int
+    username: str
+    name: str|None = None
+    role: Role
+    created_at: datetime|None = None
+
+class Schedule(OrmModel):
+    id: int
+    weekDay: int|None = None
+    startTime: time|None = None
+    endTime: time|None = None
+    user_id: int|None = None
+    inactive: bool|None = None
+
+class Worked_Time(OrmModel):
+    id: int
+    actualDate: date
+    weekDay: int
+    actualStart: time
+    actualEnd: time|None = None
+    user_id: int
+    note: str|None = None
+    active: bool
+
+class Worked_Hours_Day(OrmModel):
+    user_id: int
+    day: date
+    minutes: int
+    punches: int
+
+class Worked_Hours_Week(OrmModel):
+    user_id: int
+    isoYear: int
+    isoWeek: int
+    minutes: int
+    punches: int
+
+class Timesheet_Row(BaseModel):
+    user_id: int
+    username: str
+    name: str|None = None
+    punches: int
+    worked_hours: float
+    scheduled_hours: float
+    overtime_hours: float
+
+class Device(OrmModel):
+    id: int
+    name: str
+    code: str
+
+class Request_Info(OrmModel):
+    id: int
+    reason: str|None = None
+    startDay: datetime|None = None
+    endDay: datetime|None = None
+    type_id: int|None = None
+    user_id: int|None = None
+    requested_by: int|None = None
+
+class Processed_Request(OrmModel):
+    id: int
+    request_id: int
+    accepted: bool|None = None
+    reason: str|None = None
+    processed_at: datetime|None = None
+    admin_id: int|None = None
+
+class Request_With_Processed(BaseModel):
+    request: Request_Info
+    processed: Processed_Request|None = None
+
+class Log(OrmModel):
+    id: int
+    event: str
+    time: datetime
+    user_id: int|None = None
+
+class Import_Result(BaseModel):
+    row: int
+    status: str
+    id: int|None = None
+    message: str|None = None
+
+class Punch_Result(BaseModel):
+    index: int
+    user_id: int
+    time: datetime|None = None
+    status: str
+    message: str
+
+class Present_User(BaseModel):
+    user_id: int
+    since: datetime
+
+class Calendar_Shift(OrmModel):
+    user_id: int
+    schedule_id: int
+    day: date
+    start: datetime
+    end: datetime
+
+class Calendar_Absence(OrmModel):
+    user_id: int
+    request_id: int
+    type_id: int
+    start: datetime
+    end: datetime
+
+class Login_Response(Message):
+    user_id: int
+    session_token: str
+
+class User_Response(Message):
+    user: User_Info
+
+class Users_Response(Message):
+    users: list[User_Info]
+    next_cursor: int|None = None
+
+class Import_Response(Message):
+    results: list[Import_Result]
+
+class Schedule_Response(Message):
+    schedule: Schedule
+
+class Schedules_Response(Message):
+    schedules: list[Schedule]
+    next_cursor: int|None = None
+
+class Worked_Times_Response(Message):
+    worked_times: list[Worked_Time]
+    next_cursor: int|None = None
+
+class Timesheet_Response(Message):
+    start: date
+    end: date
+    timesheet: list[Timesheet_Row]
+
+class Worked_Hours_Response(Message):
+    worked_hours: list[Worked_Hours_Day]|list[Worked_Hours_Week]
+
+class Device_Response(Message):
+    device: Device
+
+class Devices_Response(Message):
+    device: list[Device]
+    next_cursor: int|None = None
+
+class Presence_Response(Message):
+    version: int
+    users: list[Present_User]
+
+class Calendar_Response(Message):
+    start: date
+    end: date
+    shifts: list[Calendar_Shift]
+    absences: list[Calendar_Absence]
+
+class Check_In_Code_Response(Message):
+    code: str
+    valid_until: datetime
+
+class Punch_Batch_Response(Message):
+    results: list[Punch_Result]
+
+class Request_Response(Message):
+    request: Request_Info
+    processed: Processed_Request|None = None
+
+class Requests_Response(Message):
+    requests: list[Request_With_Processed]
+    next_cursor: int|None = None
+
+class Request_Types_Response(Message):
+    request_types: list[Request_Type]
+
+class Roles_Response(Message):
+    roles: list[Role]
+
+class Logs_Response(Message):
+    logs: list[Log]
+    next_cursor: int|None = None
+
+class Stats_Response(Message):
+    session_cache: dict
+    audit_log: dict
+    hash_pool: dict
+    response_cache: dict
+    session_tokens: dict
+    log_archive: dict
+    team_calendar: dict
+    rate_limit: dict
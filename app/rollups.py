@@ -0,0 +1,82 @@
+import asyncio
+from collections import defaultdict
+from datetime import time
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from .database import AsyncSessionLocal, engine
+from .migrations import setup
+from .models import Worked_Hours_Daily, Worked_Hours_Weekly, Worked_Times
+from .reports import duration_seconds
+
+UPSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+def time_to_seconds(value: time) -> int:
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+def worked_minutes(work_time: Worked_Times) -> int:
+    ## Same rounding as the SQL rebuild, so incremental and rebuilt totals agree
+    seconds = time_to_seconds(work_time.actualEnd) - time_to_seconds(work_time.actualStart)
+    if seconds < 0:
+        seconds += 86400
+    return seconds // 60
+
+async def upsert(db: AsyncSession, model, keys: dict, minutes: int, punches: int):
+    upsert_insert = UPSERTS[db.bind.dialect.name](model).values(**keys, minutes=minutes, punches=punches)
+    await db.execute(upsert_insert.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={
+            "minutes": model.minutes + upsert_insert.excluded.minutes,
+            "punches": model.punches + upsert_insert.excluded.punches,
+        }
+    ))
+
+async def apply_worked_time(db: AsyncSession, work_time: Worked_Times, sign: int = 1):
+    ## Call with sign=-1 before changing or deleting a completed row, and sign=1 after
+    if work_time.active or work_time.actualEnd is None:
+        return
+    minutes = worked_minutes(work_time) * sign
+    isoYear, isoWeek, _ = work_time.actualDate.isocalendar()
+    await upsert(db, Worked_Hours_Daily, {"user_id": work_time.user_id, "day": work_time.actualDate}, minutes, sign)
+    await upsert(db, Worked_Hours_Weekly, {"user_id": work_time.user_id, "isoYear": isoYear, "isoWeek": isoWeek}, minutes, sign)
+
+async def rebuild(db: AsyncSession):
+    await db.execute(delete(Worked_Hours_Daily))
+    await db.execute(delete(Worked_Hours_Weekly))
+    await db.execute(insert(Worked_Hours_Daily).from_select(
+        ["user_id", "day", "minutes", "punches"],
+        select(
+            Worked_Times.user_id,
+            Worked_Times.actualDate,
+            func.sum(duration_seconds(Worked_Times.actualStart, Worked_Times.actualEnd) // 60),
+            func.count(),
+        ).where(
+            (Worked_Times.active == False) & (Worked_Times.actualEnd.is_not(None))
+        ).group_by(Worked_Times.user_id, Worked_Times.actualDate)
+    ))
+    weeks = defaultdict(lambda: [0, 0])
+    daily = await db.stream(select(Worked_Hours_Daily.user_id, Worked_Hours_Daily.day, Worked_Hours_Daily.minutes, Worked_Hours_Daily.punches))
+    async for user_id, day, minutes, punches in daily:
+        isoYear, isoWeek, _ = day.isocalendar()
+        week = weeks[(user_id, isoYear, isoWeek)]
+        week[0] += minutes
+        week[1] += punches
+    if weeks:
+        await db.execute(insert(Worked_Hours_Weekly), [
+            {"user_id": user_id, "isoYear": isoYear, "isoWeek": isoWeek, "minutes": minutes, "punches": punches}
+            for (user_id, isoYear, isoWeek), (minutes, punches) in weeks.items()
+        ])
+    await db.commit()
+    return len(weeks)
+
+async def main():
+    setup(engine)
+    async with AsyncSessionLocal() as db:
+        weeks = await rebuild(db)
+    print(f"Rebuilt worked hours rollups ({weeks} user weeks)")
+
+if __name__ == "__main__":
+    asyncio.run(main())
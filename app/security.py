@@ -1,9 +1,156 @@
+import asyncio, base64, hashlib, hmac, multiprocessing, os, string, time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+CHECK_IN_SECRET = os.getenv("CHECK_IN_SECRET")
+CHECK_IN_CODE_PERIOD = int(os.getenv("CHECK_IN_CODE_PERIOD", "60"))
+CHECK_IN_CODE_GRACE = int(os.getenv("CHECK_IN_CODE_GRACE", "60"))
+CHECK_IN_CODE_LENGTH = 16
+CHECK_IN_CODE_ALPHABET = string.ascii_letters + string.digits
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(os.cpu_count() or 1)))
+HASH_CONCURRENCY = int(os.getenv("HASH_CONCURRENCY", str(HASH_WORKERS)))
+ARGON2_SETTINGS = {
+    f"argon2__{name}": int(os.environ[env])
+    for name, env in (("time_cost", "ARGON2_TIME_COST"), ("memory_cost", "ARGON2_MEMORY_COST"), ("parallelism", "ARGON2_PARALLELISM"))
+    if os.getenv(env)
+}
+
+pwd_context = CryptContext(schemes=["argon2"], deprecated="auto", **ARGON2_SETTINGS)
 def get_password_hash(password):
     return pwd_context.hash(password)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def password_needs_rehash(hashed_password):
+    return pwd_context.needs_update(hashed_password)
+
+class HashPool:
+    def __init__(self, workers: int = HASH_WORKERS, concurrency: int = HASH_CONCURRENCY):
+        self.workers = workers
+        self.concurrency = concurrency
+        self.waiting = 0
+        self.max_waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+        self.restarts = 0
+        self._executor: ProcessPoolExecutor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def run(self, fn, *args):
+        if self._executor is None:
+            self._executor = self._start()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        queued_at = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started_at = time.monotonic()
+        self.wait_time += started_at - queued_at
+        self.in_flight += 1
+        executor = self._executor
+        try:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+            except BrokenProcessPool:
+                ## A worker that died, e.g. killed for memory, breaks the whole pool
+                if self._executor is executor:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    self._executor = self._start()
+                    self.restarts += 1
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.run_time += time.monotonic() - started_at
+            self._semaphore.release()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._semaphore = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "concurrency": self.concurrency,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "restarts": self.restarts,
+            "avg_wait_ms": self.wait_time / self.completed * 1000 if self.completed else 0.0,
+            "avg_run_ms": self.run_time / self.completed * 1000 if self.completed else 0.0,
+        }
+
+    def _start(self) -> ProcessPoolExecutor:
+        ## Forking the running server would copy its event loop, threads and open connections into the workers
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("forkserver"))
+
+hash_pool = HashPool()
+
+async def get_password_hash_async(password):
+    return await hash_pool.run(get_password_hash, password)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await hash_pool.run(verify_password, plain_password, hashed_password)
+
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    return await asyncio.gather(*(get_password_hash_async(password) for password in passwords))
+
+check_in_secret: bytes | None = CHECK_IN_SECRET.encode() if CHECK_IN_SECRET else None
+
+def set_check_in_secret(secret: str):
+    global check_in_secret
+    check_in_secret = secret.encode()
+
+def check_in_step(now: float | None = None) -> int:
+    return int((time.time() if now is None else now) // CHECK_IN_CODE_PERIOD)
+
+def check_in_code_for_step(step: int) -> str:
+    if check_in_secret is None:
+        raise RuntimeError("Check-in secret has not been configured")
+    digest = hmac.new(check_in_secret, step.to_bytes(8, "big"), hashlib.sha256).digest()
+    return ''.join(CHECK_IN_CODE_ALPHABET[byte % len(CHECK_IN_CODE_ALPHABET)] for byte in digest[:CHECK_IN_CODE_LENGTH])
+
+def get_check_in_code(now: float | None = None) -> tuple[str, float]:
+    step = check_in_step(now)
+    return check_in_code_for_step(step), (step + 1) * CHECK_IN_CODE_PERIOD
+
+def verify_check_in_code(code: str | None, now: float | None = None) -> bool:
+    if not code:
+        return False
+    now = time.time() if now is None else now
+    step = check_in_step(now)
+    ## Compared as bytes, compare_digest raises on non-ASCII str and headers can hold any latin-1 character
+    code = code.encode()
+    if hmac.compare_digest(code, check_in_code_for_step(step).encode()):
+        return True
+    previous_step_end = step * CHECK_IN_CODE_PERIOD
+    return now - previous_step_end < CHECK_IN_CODE_GRACE and hmac.compare_digest(code, check_in_code_for_step(step - 1).encode())
+
+session_secret: bytes | None = SESSION_SECRET.encode() if SESSION_SECRET else None
+
+def set_session_secret(secret: str):
+    global session_secret
+    session_secret = secret.encode()
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def sign_session_payload(payload: str) -> str:
+    if session_secret is None:
+        raise RuntimeError("Session secret has not been configured")
+    return b64encode(hmac.new(session_secret, payload.encode(), hashlib.sha256).digest()[:16])
@@ -0,0 +1,52 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from .ttlcache import TTLCache
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = int(os.getenv("SESSION_CACHE_TTL", "300"))
+
+@dataclass(frozen=True)
+class CachedRole:
+    id: int
+    role: str
+
+@dataclass(frozen=True)
+class CachedUser:
+    id: int
+    role: CachedRole
+
+class SessionCache:
+    def __init__(self, max_size: int = SESSION_CACHE_SIZE, ttl: int = SESSION_CACHE_TTL):
+        self._entries = TTLCache(max_size, ttl)
+
+    @property
+    def generation(self) -> int:
+        return self._entries.generation
+
+    def get(self, session_token: str) -> CachedUser | None:
+        return self._entries.get(session_token)
+
+    def put(self, session_token: str, user: CachedUser, activeUntil: datetime, generation: int | None = None):
+        remaining = (activeUntil - datetime.now(timezone.utc)).total_seconds()
+        if remaining <= 0:
+            return
+        ## Never outlives the session itself, and is skipped if a logout or user change came in while it was read
+        self._entries.put(session_token, user, min(self._entries.ttl, remaining), generation)
+
+    def invalidate(self, session_token: str):
+        self._entries.pop(session_token)
+
+    def invalidate_user(self, user_id: int):
+        self._entries.invalidate(lambda session_token, user: user.id == user_id)
+
+    def purge_expired(self):
+        self._entries.purge_expired()
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+session_cache = SessionCache()
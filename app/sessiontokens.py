@@ -0,0 +1,123 @@
+import hmac, os, secrets, threading, time
+from datetime import datetime, timezone
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Session_Revocations
+from .security import b64decode, b64encode, sign_session_payload
+from .sessioncache import CachedRole, CachedUser
+
+SESSION_MODE = os.getenv("SESSION_MODE", "database")
+SIGNED_SESSIONS = SESSION_MODE == "signed"
+SESSION_LIFETIME = int(os.getenv("SESSION_LIFETIME", "86400"))
+SESSION_REVOCATION_SYNC = int(os.getenv("SESSION_REVOCATION_SYNC", "5"))
+## Re-read recent revocations, ids from concurrent transactions can commit out of order
+SESSION_REVOCATION_OVERLAP = 60 * 1000
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+class SessionTokens:
+    ## Tokens are "<payload>.<signature>", the payload being user_id:role_id:issued_ms:expires:token_id:role
+    def __init__(self, lifetime: int = SESSION_LIFETIME):
+        self.lifetime = lifetime
+        self.issued = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._revoked_tokens: dict[str, float] = {}
+        self._revoked_users: dict[int, int] = {}
+        self._synced_until = 0
+        self._lock = threading.Lock()
+
+    def issue(self, user_id: int, role_id: int, role: str) -> str:
+        expires = int(time.time()) + self.lifetime
+        payload = b64encode(f"{user_id}:{role_id}:{now_ms()}:{expires}:{secrets.token_urlsafe(12)}:{role}".encode())
+        with self._lock:
+            self.issued += 1
+        return f"{payload}.{sign_session_payload(payload)}"
+
+    def read(self, session_token: str) -> tuple[CachedUser, str, int, int] | None:
+        payload, _, signature = session_token.partition(".")
+        ## Compared as bytes, a non-ASCII header value would make compare_digest raise
+        if not signature or not hmac.compare_digest(signature.encode(), sign_session_payload(payload).encode()):
+            return self._reject()
+        try:
+            user_id, role_id, issued_at, expires, token_id, role = b64decode(payload).decode().split(":", 5)
+            user_id, role_id, issued_at, expires = int(user_id), int(role_id), int(issued_at), int(expires)
+        except ValueError:
+            return self._reject()
+        if expires <= time.time():
+            return self._reject()
+        with self._lock:
+            if token_id in self._revoked_tokens or self._revoked_users.get(user_id, -1) >= issued_at:
+                self.rejected += 1
+                return None
+            self.accepted += 1
+        return CachedUser(id=user_id, role=CachedRole(id=role_id, role=role)), token_id, issued_at, expires
+
+    def validate(self, session_token: str) -> CachedUser | None:
+        claims = self.read(session_token)
+        return claims[0] if claims else None
+
+    async def revoke_token(self, db: AsyncSession, session_token: str) -> CachedUser | None:
+        claims = self.read(session_token)
+        if not claims:
+            return None
+        user, token_id, _, expires = claims
+        await self._revoke(db, Session_Revocations(user_id=user.id, token_id=token_id, revokedAt=now_ms(), activeUntil=datetime.fromtimestamp(expires, timezone.utc)))
+        return user
+
+    async def revoke_user(self, db: AsyncSession, user_id: int):
+        revokedAt = now_ms()
+        await self._revoke(db, Session_Revocations(user_id=user_id, token_id=None, revokedAt=revokedAt, activeUntil=datetime.fromtimestamp(revokedAt / 1000 + self.lifetime, timezone.utc)))
+
+    async def sync(self, db: AsyncSession):
+        ## Picks up revocations made by other workers
+        synced_until = now_ms()
+        revocations = (await db.execute(
+            select(Session_Revocations).where(Session_Revocations.revokedAt >= self._synced_until - SESSION_REVOCATION_OVERLAP)
+        )).scalars().all()
+        for revocation in revocations:
+            self._apply(revocation)
+        self._synced_until = synced_until
+
+    async def purge_expired(self, db: AsyncSession):
+        await db.execute(delete(Session_Revocations).where(Session_Revocations.activeUntil < datetime.now(timezone.utc)))
+        await db.commit()
+        now = time.time()
+        cutoff = now_ms() - self.lifetime * 1000
+        with self._lock:
+            self._revoked_tokens = {token_id: expires for token_id, expires in self._revoked_tokens.items() if expires > now}
+            self._revoked_users = {user_id: revokedAt for user_id, revokedAt in self._revoked_users.items() if revokedAt > cutoff}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": SESSION_MODE,
+                "issued": self.issued,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "revoked_tokens": len(self._revoked_tokens),
+                "revoked_users": len(self._revoked_users),
+            }
+
+    async def _revoke(self, db: AsyncSession, revocation: Session_Revocations):
+        db.add(revocation)
+        await db.commit()
+        self._apply(revocation)
+
+    def _apply(self, revocation: Session_Revocations):
+        with self._lock:
+            if revocation.token_id:
+                activeUntil = revocation.activeUntil
+                if activeUntil.tzinfo is None:
+                    activeUntil = activeUntil.replace(tzinfo=timezone.utc)
+                self._revoked_tokens[revocation.token_id] = activeUntil.timestamp()
+            else:
+                self._revoked_users[revocation.user_id] = max(self._revoked_users.get(revocation.user_id, -1), revocation.revokedAt)
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+        return None
+
+session_tokens = SessionTokens()
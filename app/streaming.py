@@ -0,0 +1,75 @@
+import csv, io, json, os
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+from .database import AsyncSessionLocal
+
+STREAM_BATCH_SIZE = 500
+STREAM_CHUNK_SIZE = 64 * 1024
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+STREAM_MEDIA_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+async def stream_rows(query: Select):
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for row in result.mappings():
+            yield dict(row)
+
+async def json_array_stream(rows):
+    buffer = io.StringIO()
+    buffer.write("[")
+    first = True
+    async for row in rows:
+        if not first:
+            buffer.write(",")
+        first = False
+        buffer.write(json.dumps(jsonable_encoder(row)))
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer = io.StringIO()
+    buffer.write("]")
+    yield buffer.getvalue()
+
+async def ndjson_stream(rows):
+    buffer = io.StringIO()
+    async for row in rows:
+        buffer.write(json.dumps(jsonable_encoder(row)))
+        buffer.write("\n")
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+async def csv_stream(rows, fieldnames: list[str]):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    async for row in rows:
+        writer.writerow(jsonable_encoder(row))
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_format(format: str | None, accept: str | None) -> str | None:
+    ## The format parameter wins over Accept, anything else is the regular paginated JSON
+    if format:
+        return format if format in ("ndjson", "csv") else None
+    for media_type in (accept or "").split(","):
+        media_type = media_type.split(";")[0].strip()
+        if media_type in STREAM_MEDIA_TYPES:
+            return STREAM_MEDIA_TYPES[media_type]
+    return None
+
+def stream_response(rows, fieldnames: list[str], format: str, filename: str) -> StreamingResponse:
+    if format == "csv":
+        return StreamingResponse(csv_stream(rows, fieldnames), media_type="text/csv", headers={"Content-Disposition": f"attachment; filename={filename}.csv"})
+    return StreamingResponse(ndjson_stream(rows), media_type="application/x-ndjson")
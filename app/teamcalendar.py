@@ -0,0 +1,163 @@
+import bisect, os
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from .models import Processed_Requests, Request_Types, Requests, Scheduled_Times, Users
+from .ttlcache import TTLCache
+
+MAX_CALENDAR_DAYS = int(os.getenv("MAX_CALENDAR_DAYS", "366"))
+## Approved requests of these types are cut out of the shifts, others such as overtid are not
+ABSENCE_TYPES = [type_name.strip() for type_name in os.getenv("ABSENCE_TYPES", "ferie,sygdom").split(",") if type_name.strip()]
+CALENDAR_CACHE_SIZE = int(os.getenv("CALENDAR_CACHE_SIZE", "20000"))
+CALENDAR_CACHE_TTL = int(os.getenv("CALENDAR_CACHE_TTL", "60"))
+
+@dataclass
+class Shift:
+    user_id: int
+    schedule_id: int
+    day: date
+    start: datetime
+    end: datetime
+
+@dataclass
+class Absence:
+    user_id: int
+    request_id: int
+    type_id: int
+    start: datetime
+    end: datetime
+
+@dataclass
+class CalendarWeek:
+    shifts: list[Shift]
+    absences: list[Absence]
+
+def naive_utc(value: datetime) -> datetime:
+    ## Schedules are wall clock times, absences are compared to them without a timezone
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+class IntervalIndex:
+    ## Sorted, merged intervals, an overlap lookup is a bisect plus the intervals it overlaps
+    def __init__(self, intervals):
+        merged = []
+        for start, end in sorted(intervals):
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = [start for start, _ in merged]
+        self.ends = [end for _, end in merged]
+
+    def subtract(self, start: datetime, end: datetime) -> list[tuple[datetime, datetime]]:
+        pieces = []
+        index = bisect.bisect_right(self.ends, start)
+        while index < len(self.starts) and self.starts[index] < end:
+            if self.starts[index] > start:
+                pieces.append((start, self.starts[index]))
+            start = max(start, self.ends[index])
+            index += 1
+        if start < end:
+            pieces.append((start, end))
+        return pieces
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+def expand_week(user_id: int, week: date, schedules: list[Scheduled_Times], absences: IntervalIndex) -> list[Shift]:
+    shifts = []
+    for offset in range(7):
+        day = week + timedelta(days=offset)
+        for schedule in schedules:
+            if schedule.weekDay != day.weekday() + 1:
+                continue
+            start = datetime.combine(day, schedule.startTime)
+            end = datetime.combine(day, schedule.endTime)
+            ## Shifts that end before they start run past midnight
+            if end <= start:
+                end += timedelta(days=1)
+            shifts.extend(Shift(user_id, schedule.id, day, piece_start, piece_end) for piece_start, piece_end in absences.subtract(start, end))
+    return shifts
+
+class TeamCalendar:
+    def __init__(self, max_size: int = CALENDAR_CACHE_SIZE, ttl: int = CALENDAR_CACHE_TTL):
+        self._weeks = TTLCache(max_size, ttl)
+
+    async def expand(self, db: AsyncSession, start: date, end: date, user_ids: list[int] | None = None) -> tuple[list[Shift], list[Absence]]:
+        all_users = user_ids is None
+        if all_users:
+            user_ids = (await db.execute(select(Users.id).order_by(Users.id))).scalars().all()
+        else:
+            user_ids = sorted(set(user_ids))
+        weeks = [week_start(start) + timedelta(weeks=index) for index in range((week_start(end) - week_start(start)).days // 7 + 1)]
+        cached = {}
+        missing_users, missing_weeks = set(), set()
+        generation = self._weeks.generation
+        for user_id in user_ids:
+            for week in weeks:
+                entry = self._weeks.get((user_id, week))
+                if entry is None:
+                    missing_users.add(user_id)
+                    missing_weeks.add(week)
+                else:
+                    cached[(user_id, week)] = entry
+        if missing_users:
+            ## Without a user filter the queries skip the IN list
+            loaded = await self._load(db, sorted(missing_users), sorted(missing_weeks), not (all_users and len(missing_users) == len(user_ids)))
+            ## Weeks loaded before a schedule or request changed are not cached
+            for key, entry in loaded.items():
+                self._weeks.put(key, entry, generation=generation)
+            cached.update(loaded)
+
+        shifts, absences, seen = [], [], set()
+        first, last = datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+        for user_id in user_ids:
+            for week in weeks:
+                entry = cached[(user_id, week)]
+                shifts.extend(shift for shift in entry.shifts if start <= shift.day <= end)
+                for absence in entry.absences:
+                    ## Absences spanning several weeks are in each of them
+                    if absence.start < last and absence.end > first and absence.request_id not in seen:
+                        seen.add(absence.request_id)
+                        absences.append(Absence(absence.user_id, absence.request_id, absence.type_id, max(absence.start, first), min(absence.end, last)))
+        return shifts, absences
+
+    def invalidate(self):
+        self._weeks.invalidate()
+
+    def stats(self) -> dict:
+        return self._weeks.stats()
+
+    async def _load(self, db: AsyncSession, user_ids: list[int], weeks: list[date], filter_users: bool) -> dict[tuple[int, date], CalendarWeek]:
+        first = datetime.combine(weeks[0], datetime.min.time())
+        ## One extra day for shifts that start on the last Sunday and run past midnight
+        last = datetime.combine(weeks[-1] + timedelta(days=8), datetime.min.time())
+        schedule_query = select(Scheduled_Times).where(or_(Scheduled_Times.inactive == False, Scheduled_Times.inactive.is_(None)))
+        absence_query = select(Requests).join(Processed_Requests).join(Request_Types).where(
+            (Processed_Requests.accepted == True) & (Request_Types.type_name.in_(ABSENCE_TYPES)) & (Requests.startDay < last) & (Requests.endDay > first)
+        )
+        if filter_users:
+            schedule_query = schedule_query.where(Scheduled_Times.user_id.in_(user_ids))
+            absence_query = absence_query.where(Requests.user_id.in_(user_ids))
+        schedules, absences = defaultdict(list), defaultdict(list)
+        for schedule in (await db.execute(schedule_query)).scalars():
+            schedules[schedule.user_id].append(schedule)
+        for request in (await db.execute(absence_query)).scalars():
+            absences[request.user_id].append(Absence(request.user_id, request.id, request.type_id, naive_utc(request.startDay), naive_utc(request.endDay)))
+
+        loaded = {}
+        for user_id in user_ids:
+            index = IntervalIndex((absence.start, absence.end) for absence in absences[user_id])
+            for week in weeks:
+                week_first = datetime.combine(week, datetime.min.time())
+                week_last = week_first + timedelta(days=7)
+                loaded[(user_id, week)] = CalendarWeek(
+                    expand_week(user_id, week, schedules[user_id], index),
+                    [absence for absence in absences[user_id] if absence.start < week_last and absence.end > week_first],
+                )
+        return loaded
+
+team_calendar = TeamCalendar()
@@ -0,0 +1,82 @@
+import threading, time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any
+
+class TTLCache:
+    ## LRU map whose entries also expire, the ttl bounds how long a worker can serve data another worker has invalidated
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        ## Bumped by every invalidation, puts of values loaded before it are skipped
+        self.generation = 0
+        self._entries: OrderedDict[Hashable, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, ttl: float | None = None, generation: int | None = None):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+            self.generation += 1
+            self.invalidations += 1
+
+    def invalidate(self, predicate: Callable[[Hashable, Any], bool] | None = None):
+        with self._lock:
+            if predicate is None:
+                self._entries.clear()
+            else:
+                for key in [key for key, (value, _) in self._entries.items() if predicate(key, value)]:
+                    del self._entries[key]
+            self.generation += 1
+            self.invalidations += 1
+
+    def purge_expired(self):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
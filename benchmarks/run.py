@@ -0,0 +1,134 @@
+import argparse, asyncio, json, os, platform, statistics, sys, tempfile, time
+from datetime import datetime, timezone
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the API's hot paths in-process")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"), help="Database to seed and run against. Defaults to a fresh SQLite file")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--years", type=int, default=2, help="Years of worked times per user")
+    parser.add_argument("--requests", type=int, default=5000, help="Number of requests (ferie, sygdom, ...) to seed")
+    parser.add_argument("--iterations", type=int, default=500, help="Measured calls per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--scenarios", default="login,valid_session,check_in_out,requests_processed,requests_pending,users")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    return parser.parse_args()
+
+def percentile(quantiles: list[float], p: int) -> float:
+    return round(quantiles[p - 1], 3)
+
+def summarize(name: str, latencies: list[float], statuses: list[int], wall: float, queries: int) -> dict:
+    latencies_ms = [latency * 1000 for latency in latencies]
+    quantiles = statistics.quantiles(latencies_ms, n=100, method="inclusive") if len(latencies_ms) > 1 else latencies_ms * 99
+    return {
+        "scenario": name,
+        "calls": len(latencies),
+        "errors": sum(1 for status_code in statuses if status_code >= 400),
+        "p50_ms": percentile(quantiles, 50),
+        "p95_ms": percentile(quantiles, 95),
+        "p99_ms": percentile(quantiles, 99),
+        "mean_ms": round(statistics.fmean(latencies_ms), 3),
+        "max_ms": round(max(latencies_ms), 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "queries": queries,
+        "queries_per_call": round(queries / len(latencies), 2),
+    }
+
+async def measure(call, count: int, concurrency: int) -> tuple[list[float], list[int], float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = [0.0] * count
+    statuses = [0] * count
+
+    async def timed(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await call(index)
+            latencies[index] = time.perf_counter() - started
+            statuses[index] = response.status_code
+
+    started = time.perf_counter()
+    await asyncio.gather(*(timed(index) for index in range(count)))
+    return latencies, statuses, time.perf_counter() - started
+
+async def run(args, dataset: dict) -> list[dict]:
+    import httpx
+    from sqlalchemy import event
+    from app.database import async_engine
+    from app.main import app
+    from app.security import get_check_in_code
+    from .seed import BENCH_PASSWORD
+
+    query_count = 0
+    def count_query(*_):
+        nonlocal query_count
+        query_count += 1
+    event.listen(async_engine.sync_engine, "before_cursor_execute", count_query)
+
+    usernames = dataset["usernames"]
+    user_ids = list(usernames)
+    results = []
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            response = await client.post("/login", json={"username": "Admin", "password": "1234"})
+            admin_headers = {"session-token": response.json()["session_token"]}
+            tokens = []
+            for user_id in user_ids[:max(1, args.concurrency)]:
+                response = await client.post("/login", json={"username": usernames[user_id], "password": BENCH_PASSWORD})
+                tokens.append(response.json()["session_token"])
+
+            scenarios = {
+                "login": lambda index: client.post("/login", json={"username": usernames[user_ids[index % len(user_ids)]], "password": BENCH_PASSWORD}),
+                "valid_session": lambda index: client.get("/valid_session", headers={"session-token": tokens[index % len(tokens)]}),
+                "check_in_out": lambda index: client.post(f"/check_in_out/{user_ids[index % len(user_ids)]}", headers={"check-in-code": get_check_in_code()[0]}),
+                "requests_processed": lambda index: client.get("/requests/true", headers=admin_headers),
+                "requests_pending": lambda index: client.get("/requests/false", headers=admin_headers),
+                "users": lambda index: client.get("/users", headers=admin_headers, params={"amount": 100}),
+            }
+            for name in args.scenarios.split(","):
+                call = scenarios[name]
+                await measure(call, args.warmup, args.concurrency)
+                queries_before = query_count
+                latencies, statuses, wall = await measure(call, args.iterations, args.concurrency)
+                results.append(summarize(name, latencies, statuses, wall, query_count - queries_before))
+                print(json.dumps(results[-1]), file=sys.stderr)
+    return results
+
+def main():
+    args = parse_args()
+    if not args.database_url:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    ## Settings are read when app modules are imported
+    os.environ["DATABASE_URL"] = args.database_url
+    ## Every call comes from one client, so the login and check-in limits would reject most of them
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+
+    from app.database import SessionLocal, engine
+    from app.migrations import setup
+    from .seed import seed
+
+    setup(engine)
+    with SessionLocal() as session:
+        started = time.perf_counter()
+        dataset = seed(session, args.users, args.years, args.requests, args.seed)
+        seed_seconds = time.perf_counter() - started
+
+    started_at = datetime.now(timezone.utc)
+    results = asyncio.run(run(args, dataset))
+    report = {
+        "started_at": started_at.isoformat(),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "database_url")},
+        "dataset": {key: value for key, value in dataset.items() if key != "usernames"},
+        "seed_seconds": round(seed_seconds, 2),
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import random
+from datetime import date, datetime, time, timedelta, timezone
+from sqlalchemy import func, insert, select
+from app.models import Processed_Requests, Request_Types, Requests, Roles, Users, Worked_Times
+from app.security import get_password_hash
+
+BENCH_PASSWORD = "bench"
+
+def workdays(start: date, end: date):
+    day = start
+    while day <= end:
+        if day.weekday() < 5:
+            yield day
+        day += timedelta(days=1)
+
+def seed_users(session, count: int) -> dict[int, str]:
+    role_id = session.execute(select(Roles.id).where(Roles.role == "medarbejder")).scalar_one()
+    ## One hash for everyone, argon2 per user would dominate seeding time
+    hashed_pass = get_password_hash(BENCH_PASSWORD)
+    first = session.execute(select(func.count()).select_from(Users)).scalar_one()
+    usernames = [f"bench{first + index}" for index in range(count)]
+    user_ids = session.execute(insert(Users).returning(Users.id, sort_by_parameter_order=True), [
+        {"username": username, "name": f"Bench User {username[5:]}", "role_id": role_id, "hashed_pass": hashed_pass}
+        for username in usernames
+    ]).scalars().all()
+    session.commit()
+    return dict(zip(user_ids, usernames))
+
+def seed_worked_times(session, rng: random.Random, user_ids: list[int], years: int, batch_size: int = 10000) -> int:
+    end = date.today() - timedelta(days=1)
+    start = end - timedelta(days=365 * years)
+    rows = []
+    total = 0
+    for day in workdays(start, end):
+        for user_id in user_ids:
+            actualStart = time(rng.randint(6, 9), rng.randint(0, 59))
+            actualEnd = time(rng.randint(14, 17), rng.randint(0, 59))
+            rows.append({
+                "actualDate": day, "weekDay": day.weekday() + 1, "actualStart": actualStart, "actualEnd": actualEnd,
+                "user_id": user_id, "note": "", "active": False,
+            })
+            if len(rows) >= batch_size:
+                session.execute(insert(Worked_Times), rows)
+                total += len(rows)
+                rows = []
+    if rows:
+        session.execute(insert(Worked_Times), rows)
+        total += len(rows)
+    session.commit()
+    return total
+
+def seed_requests(session, rng: random.Random, user_ids: list[int], count: int, processed_ratio: float = 0.5) -> int:
+    type_ids = session.execute(select(Request_Types.id)).scalars().all()
+    admin_id = session.execute(select(Users.id).where(Users.username == "Admin")).scalar_one()
+    now = datetime.now(timezone.utc)
+    rows = []
+    for _ in range(count):
+        startDay = now + timedelta(days=rng.randint(-365, 365))
+        user_id = rng.choice(user_ids)
+        rows.append({
+            "reason": "benchmark", "startDay": startDay, "endDay": startDay + timedelta(days=rng.randint(0, 14)),
+            "type_id": rng.choice(type_ids), "user_id": user_id, "requested_by": user_id,
+        })
+    request_ids = session.execute(insert(Requests).returning(Requests.id, sort_by_parameter_order=True), rows).scalars().all()
+    processed = [
+        {"request_id": request_id, "accepted": rng.random() < 0.8, "reason": "benchmark", "admin_id": admin_id}
+        for request_id in request_ids if rng.random() < processed_ratio
+    ]
+    if processed:
+        session.execute(insert(Processed_Requests), processed)
+    session.commit()
+    return len(request_ids)
+
+def seed(session, users: int, years: int, requests: int, random_seed: int = 1) -> dict:
+    rng = random.Random(random_seed)
+    usernames = seed_users(session, users)
+    user_ids = list(usernames)
+    worked_times = seed_worked_times(session, rng, user_ids, years)
+    request_count = seed_requests(session, rng, user_ids, requests)
+    return {"users": len(user_ids), "worked_times": worked_times, "requests": request_count, "usernames": usernames}